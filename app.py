@@ -1,7 +1,12 @@
-from flask import Flask, render_template, request, jsonify
-import io, csv, re
-import redis, psycopg2, datetime
-from flask_socketio import SocketIO
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
+import os, json, functools, tempfile, uuid
+import redis, datetime
+from flask_socketio import SocketIO, join_room
+from security_db import SecurityMasterDB
+from redis_store import KEY_FIELDS, INDEXED_FIELDS, DEFAULT_BATCH_SIZE, iter_record_keys, find_keys_by_fields, page_registry, page_keys, fetch_records, read_aggregates, company_index_key, get_generation, make_record_key, read_rule_trace
+from response_cache import ResponseCache
+from issue_spool import read_issues, remove_expired
+from soi_jobs import SoiJobRunner
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'secret!'
@@ -9,75 +14,83 @@ socketio = SocketIO(app)
 
 ### Redis Setup ###
 redis_client = redis.Redis(host="localhost", port=6379, db=0)
+# Commands per pipeline when reading records from Redis
+app.config['REDIS_PIPELINE_SIZE'] = int(os.environ.get("REDIS_PIPELINE_SIZE", DEFAULT_BATCH_SIZE))
+
+# Cache of /data and /dashboard_data responses, valid until the next load (0 disables it)
+app.config['RESPONSE_CACHE_BYTES'] = int(os.environ.get("RESPONSE_CACHE_BYTES", 64 * 1024 * 1024))
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_BYTES'])
+
+def generation_cached(view):
+    """
+    Serves a JSON route from response_cache, keyed by path + query string and stamped with
+    the current Redis load generation. Nothing is cached while a full reload is running.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        generation = get_generation(redis_client)
+        if generation is None or not app.config['RESPONSE_CACHE_BYTES']:
+            return view(*args, **kwargs)
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        payload = response_cache.get(generation, key)
+        if payload is not None:
+            return Response(payload, mimetype="application/json", headers={"X-Cache": "HIT"})
+        response = view(*args, **kwargs)
+        if response.status_code == 200:
+            response_cache.put(generation, key, response.get_data())
+        response.headers["X-Cache"] = "MISS"
+        return response
+    return wrapper
+
+# Default and maximum number of rows per /data page
+DATA_PAGE_SIZE = 100
+DATA_MAX_PAGE_SIZE = 1000
 
 ### Postgres Helpers ###
+# Pooled access to security_master; the DSN and pool size can be set from the environment
+app.config['POSTGRES_DSN'] = os.environ.get("POSTGRES_DSN", "dbname=postgres user=jez host=localhost port=5432")
+app.config['POSTGRES_POOL_SIZE'] = int(os.environ.get("POSTGRES_POOL_SIZE", 10))
+security_db = SecurityMasterDB(app.config['POSTGRES_DSN'], table_name="security_master",
+                               maxconn=app.config['POSTGRES_POOL_SIZE'])
+
 def get_latest_security_record(params):
-    fields = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
-    where_clause = " AND ".join([f'"{field}" = %s' for field in fields])
-    sql = f"""
-          SELECT * FROM security_master 
-          WHERE {where_clause}
-          ORDER BY applied_date DESC LIMIT 1;
-          """
-    values = [params.get(field, "") for field in fields]
     try:
-        conn = psycopg2.connect(dbname="postgres", user="jez", password="",
-                                  host="localhost", port=5432)
-        cur = conn.cursor()
-        cur.execute(sql, values)
-        row = cur.fetchone()
-        colnames = [desc[0] for desc in cur.description] if row else []
-        conn.close()
-        return dict(zip(colnames, row)) if row else {}
+        return security_db.get_latest_record(params)
     except Exception as e:
         print("Error querying Postgres:", e)
         return {}
 
 def get_all_security_versions(params):
-    fields = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
-    where_clause = " AND ".join([f'"{field}" = %s' for field in fields])
-    sql = f"""
-          SELECT DISTINCT ON (applied_date) *
-          FROM security_master 
-          WHERE {where_clause}
-          ORDER BY applied_date DESC;
-          """
-    values = [params.get(field, "") for field in fields]
     try:
-        conn = psycopg2.connect(dbname="postgres", user="jez", password="",
-                                  host="localhost", port=5432)
-        cur = conn.cursor()
-        cur.execute(sql, values)
-        rows = cur.fetchall()
-        colnames = [desc[0] for desc in cur.description]
-        conn.close()
-        return [dict(zip(colnames, row)) for row in rows]
+        return security_db.get_all_versions(params)
     except Exception as e:
         print("Error querying Postgres for versions:", e)
         return []
 
+def get_security_detail(params):
+    try:
+        record, versions = security_db.get_security_detail(params)
+    except Exception as e:
+        print("Error querying Postgres for security detail:", e)
+        record, versions = {}, []
+    record.setdefault("days_since_last_update", "N/A")
+    record.setdefault("age", "N/A")
+    return record, versions
+
 def get_security_record_by_date(params, applied_date):
-    fields = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
-    where_clause = " AND ".join([f'"{field}" = %s' for field in fields])
-    sql = f"""
-          SELECT * FROM security_master 
-          WHERE {where_clause} AND applied_date = %s 
-          LIMIT 1;
-          """
-    values = [params.get(field, "") for field in fields] + [applied_date]
     try:
-        conn = psycopg2.connect(dbname="postgres", user="jez", password="",
-                                  host="localhost", port=5432)
-        cur = conn.cursor()
-        cur.execute(sql, values)
-        row = cur.fetchone()
-        colnames = [desc[0] for desc in cur.description] if row else []
-        conn.close()
-        return dict(zip(colnames, row)) if row else {}
+        return security_db.get_record_by_date(params, applied_date)
     except Exception as e:
         print("Error querying Postgres by date:", e)
         return {}
 
+def get_rule_trace(params, applied_date=None):
+    try:
+        return read_rule_trace(redis_client, make_record_key(params), applied_date)
+    except Exception as e:
+        print("Error reading rule trace from Redis:", e)
+        return []
+
 ### Custom Jinja Filter to detect type ###
 @app.template_filter('detect_type')
 def detect_type(value):
@@ -105,76 +118,90 @@ def detect_type(value):
 def index():
     return render_template("grid.html")
 
+### Streaming Responses ###
+# Records encoded per chunk of this many rows when streaming
+STREAM_CHUNK_ROWS = 500
+
+def _chunked(lines):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= STREAM_CHUNK_ROWS:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+def _ndjson_lines(records):
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+def _json_array_lines(records):
+    yield "["
+    separator = ""
+    for record in records:
+        yield separator + json.dumps(record)
+        separator = ","
+    yield "]"
+
+def stream_records(records):
+    """
+    Streams an iterable of records without materializing it: as NDJSON (one record per line)
+    when the request asks for ?format=ndjson, otherwise as a JSON array encoded incrementally.
+    """
+    if request.args.get("format") == "ndjson":
+        body, mimetype = _ndjson_lines(records), "application/x-ndjson"
+    else:
+        body, mimetype = _json_array_lines(records), "application/json"
+    return Response(stream_with_context(_chunked(body)), mimetype=mimetype)
+
 @app.route("/dataz")
 def dataz():
-    keys = redis_client.keys("*")
-    records = []
-    for key in keys:
-        rec = redis_client.hgetall(key)
-        record = {k.decode("utf-8"): v.decode("utf-8") for k, v in rec.items()}
-        filtered = {field: record.get(field, "") for field in [
-            "figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"
-        ]}
-        records.append(filtered)
-    return jsonify(records)
+    # SCAN and read one pipeline of records at a time while the response is being sent
+    keys = iter_record_keys(redis_client)
+    return stream_records(fetch_records(redis_client, keys, KEY_FIELDS, app.config["REDIS_PIPELINE_SIZE"]))
 
 @app.route("/data")
+@generation_cached
 def data():
+    """
+    Returns one page of the inventory grid as {"rows": [...], "lastRow": total, "nextCursor": key}.
+    Pages are addressed either by offset (start/end, as sent by the AG Grid infinite row model)
+    or by cursor (the nextCursor of the previous page).
+    """
     # Define the key fields to return (including APPLIED_DATE)
     key_fields = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group", "applied_date"]
     
     # Retrieve filter values from the query string (if any)
-    filter_asset_class = request.args.get("asset_class", "").strip()
-    filter_asset_group = request.args.get("asset_group", "").strip()
+    filters = {field: request.args.get(field, "").strip() for field in INDEXED_FIELDS}
+    filters = {field: value for field, value in filters.items() if value}
+    
+    # Retrieve the requested page
+    start = max(request.args.get("start", 0, type=int), 0)
+    end = request.args.get("end", start + DATA_PAGE_SIZE, type=int)
+    limit = min(max(end - start, 0), DATA_MAX_PAGE_SIZE)
+    cursor = request.args.get("cursor", "")
+    
+    if filters:
+        # Resolve the filters against the index sets, so only matching records are fetched
+        keys, total = page_keys(find_keys_by_fields(redis_client, filters), start, limit, cursor)
+    else:
+        keys, total = page_registry(redis_client, start, limit, cursor)
     
-    # Fetch up to 1000 keys from Redis
-    keys = redis_client.keys("*")[:1000]
-    records = []
-    for key in keys:
-        rec = redis_client.hgetall(key)
-        # Decode each field from bytes to strings
-        record = {k.decode("utf-8"): v.decode("utf-8") for k, v in rec.items()}
-        # Apply asset_class filter if provided
-        if filter_asset_class and record.get("asset_class", "").strip() != filter_asset_class:
-            continue
-        # Apply asset_group filter if provided
-        if filter_asset_group and record.get("asset_group", "").strip() != filter_asset_group:
-            continue
-        # Include only the specified key fields in the output
-        filtered = {field: record.get(field, "") for field in key_fields}
-        records.append(filtered)
-    return jsonify(records)
+    # Fetch only the displayed fields of the records on this page
+    records = list(fetch_records(redis_client, keys, key_fields, app.config["REDIS_PIPELINE_SIZE"]))
+    next_cursor = keys[-1].decode("utf-8") if len(keys) == limit and keys else None
+    return jsonify({"rows": records, "lastRow": total, "nextCursor": next_cursor})
 
 @app.route("/security_detail")
 def security_detail():
     key_fields = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
     params = { field: request.args.get(field, "") for field in key_fields }
-    record = get_latest_security_record(params)
-    versions = get_all_security_versions(params)
-    
-    today = datetime.date.today()
-    if versions and len(versions) > 1:
-        try:
-            latest_date = datetime.datetime.strptime(versions[0]["applied_date"], "%Y-%m-%d").date()
-            previous_date = datetime.datetime.strptime(versions[1]["applied_date"], "%Y-%m-%d").date()
-            days_since_last_update = abs((latest_date - previous_date).days)
-        except Exception as e:
-            print("Error computing days since last update:", e)
-            days_since_last_update = "N/A"
-    else:
-        days_since_last_update = "N/A"
-        
-    try:
-        applied_date = datetime.datetime.strptime(record.get("applied_date", ""), "%Y-%m-%d").date()
-        age = abs((today - applied_date).days)
-    except Exception as e:
-        print("Error computing age:", e)
-        age = "N/A"
-    
-    record["days_since_last_update"] = days_since_last_update
-    record["age"] = age
-    
-    return render_template("security_detail.html", record=record, versions=versions)
+    # Latest record, versions and the days_since_last_update / age figures come from one query
+    record, versions = get_security_detail(params)
+    # Rule engine issues come from the security's own rule_trace list
+    issues = get_rule_trace(params)
+    return render_template("security_detail.html", record=record, versions=versions, issues=issues)
 
 @app.route("/security_detail_json")
 def security_detail_json():
@@ -184,6 +211,14 @@ def security_detail_json():
     record = get_security_record_by_date(params, applied_date)
     return jsonify(record)
 
+@app.route("/security_rule_trace")
+def security_rule_trace():
+    """Return the rule engine issues of one security, optionally only those of ?applied_date=."""
+    key_fields = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
+    params = { field: request.args.get(field, "") for field in key_fields }
+    applied_date = request.args.get("applied_date", "")
+    return jsonify(get_rule_trace(params, applied_date))
+
 @app.route("/security_versions")
 def security_versions():
     key_fields = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
@@ -209,28 +244,29 @@ def company_detail():
 
 @app.route("/company_data")
 def company_data():
-    """Return JSON data filtered by company_name."""
-    company_name = request.args.get("company_name", "").lower()
-    keys = redis_client.keys("*")
-    records = []
-    for key in keys:
-        rec = redis_client.hgetall(key)
-        record = {k.decode("utf-8"): v.decode("utf-8") for k, v in rec.items()}
-        # Check if the record's company_name (if exists) matches (case-insensitive)
-        if record.get("company_name", "").lower() == company_name:
-            filtered = {field: record.get(field, "") for field in [
-                "figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"
-            ]}
-            records.append(filtered)
-    return jsonify(records)
-
-# Define regex patterns for validation
-PATTERNS = {
-    "FIGI": r"^BBG[A-Z0-9]{8}\d$",
-    "CUSIP": r"^[A-Z0-9*@#]{9}$",
-    "SEDOL": r"^[A-Z0-9]{7}$",
-    "ISIN": r"^[A-Z]{2}[A-Z0-9]{9}\d$"
-}
+    """Return JSON data filtered by company_name (NDJSON with ?format=ndjson)."""
+    company_name = request.args.get("company_name", "")
+    # Resolve the company's records through the case-insensitive company_name index
+    keys = sorted(redis_client.smembers(company_index_key(company_name)))
+    return stream_records(fetch_records(redis_client, keys, KEY_FIELDS, app.config["REDIS_PIPELINE_SIZE"]))
+
+# SOI uploads are validated in the background by a process pool (see soi_jobs.py); their
+# progress is pushed to the job's Socket.IO room as "soi_job_progress" events. Issues are
+# spooled to disk and paged through /upload_soi_errors; the final report carries the counts
+# and only the first SOI_ERROR_PREVIEW issues.
+app.config['SOI_ERROR_PREVIEW'] = int(os.environ.get("SOI_ERROR_PREVIEW", 1000))
+app.config['SOI_ERROR_SPOOL_DIR'] = os.environ.get("SOI_ERROR_SPOOL_DIR",
+                                                   os.path.join(tempfile.gettempdir(), "soi_upload_errors"))
+app.config['SOI_ERROR_SPOOL_TTL'] = int(os.environ.get("SOI_ERROR_SPOOL_TTL", 3600))
+app.config['SOI_JOB_WORKERS'] = int(os.environ.get("SOI_JOB_WORKERS", 2))
+# Check digit scheme of uploads (see check_digits.SCHEMES): "soi", the algorithms SOIGenerator
+# writes, or "published".
+app.config['SOI_CHECK_DIGITS'] = os.environ.get("SOI_CHECK_DIGITS", "soi")
+soi_jobs = SoiJobRunner(app.config['SOI_ERROR_SPOOL_DIR'], app.config['SOI_JOB_WORKERS'],
+                        emit=lambda state: socketio.emit("soi_job_progress", state, to=state["jobId"]),
+                        start_background_task=socketio.start_background_task,
+                        preview_size=app.config['SOI_ERROR_PREVIEW'],
+                        check_digits=app.config['SOI_CHECK_DIGITS'])
 
 @app.route("/upload_soi", methods=["POST"])
 def upload_soi():
@@ -240,85 +276,55 @@ def upload_soi():
     if file.filename == "":
         return jsonify({"error": "No file selected"}), 400
 
-    try:
-        content = file.stream.read()
-        try:
-            decoded = content.decode("utf-8")
-        except UnicodeDecodeError:
-            decoded = content.decode("utf-8-sig")
-        stream = io.StringIO(decoded)
-    except Exception as e:
-        return jsonify({"error": "File decoding error", "details": str(e)}), 400
-
-    reader = csv.DictReader(stream)
-    total_rows = 0
-    error_count = 0
-    error_data = []
-
-    for i, row in enumerate(reader, start=1):
-        total_rows += 1
-        row_errors = []
-        for field, pattern in PATTERNS.items():
-            value = row.get(field, "").strip()
-            # Only check if value is not empty; if it doesn't match the pattern, mark it as an error.
-            if value and not re.match(pattern, value):
-                row_errors.append({
-                    "RowNumber": i,
-                    "UniqueKey": "",  # will be computed below
-                    "Field": field,
-                    "FieldValue": value,
-                    "Issue": "Error",
-                    "Message": f"Value does not match expected pattern for {field}."
-                })
-        if row_errors:
-            error_count += 1
-            unique_key = "|".join([
-                row.get("FIGI", "").strip(),
-                row.get("CUSIP", "").strip(),
-                row.get("SEDOL", "").strip(),
-                row.get("ISIN", "").strip()
-            ])
-            for err in row_errors:
-                err["UniqueKey"] = unique_key
-            error_data.extend(row_errors)
-
-    summary = {
-        "totalRows": total_rows,
-        "errorCount": error_count,
-        "errorData": error_data
-    }
-    return jsonify(summary)
+    spool_dir = app.config['SOI_ERROR_SPOOL_DIR']
+    remove_expired(spool_dir, app.config['SOI_ERROR_SPOOL_TTL'], suffixes=(".jsonl", ".idx", ".json"))
+    soi_jobs.remove_expired(app.config['SOI_ERROR_SPOOL_TTL'])
+    os.makedirs(spool_dir, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    upload_path = os.path.join(spool_dir, job_id + ".upload")
+    file.save(upload_path)
+    soi_jobs.submit(job_id, upload_path)
+    return jsonify({"jobId": job_id, "status": "queued"}), 202
+
+@app.route("/upload_soi_status")
+def upload_soi_status():
+    """State of an SOI validation job; once it is "done" it includes the summary."""
+    state = soi_jobs.status(request.args.get("job_id", ""))
+    if state is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(state)
 
+@socketio.on("watch_soi_job")
+def watch_soi_job(message):
+    # Progress of a job is only sent to the clients watching it; the reply acknowledges the
+    # join, after which the client fetches the status to catch up on earlier progress
+    join_room(message["jobId"])
+    return True
 
+@app.route("/upload_soi_errors")
+def upload_soi_errors():
+    """Pages through the issues of an SOI upload: upload_id plus start/end, as for /data."""
+    start = max(request.args.get("start", 0, type=int), 0)
+    end = request.args.get("end", start + DATA_PAGE_SIZE, type=int)
+    end = start + min(max(end - start, 0), DATA_MAX_PAGE_SIZE)
+    page = read_issues(app.config['SOI_ERROR_SPOOL_DIR'], request.args.get("upload_id", ""), start, end)
+    if page is None:
+        return jsonify({"error": "Unknown or expired upload"}), 404
+    rows, total = page
+    return jsonify({"rows": rows, "lastRow": total})
 
 @app.route("/dashboard")
 def dashboard():
     return render_template("dashboard.html")
 
 @app.route("/dashboard_data")
+@generation_cached
 def dashboard_data():
-    asset_classes = {}
-    asset_groups = {}
-    
-    # Iterate over all keys in Redis.
-    # For a large dataset, consider using a SCAN-based approach or storing aggregated counts.
-    for key in redis_client.scan_iter("*"):
-        try:
-            record = redis_client.hgetall(key)
-            # Decode the record from bytes to strings
-            record = {k.decode("utf-8"): v.decode("utf-8") for k, v in record.items()}
-            # Get asset_class and asset_group (default to 'Unknown' if missing)
-            ac = record.get("asset_class", "Unknown")
-            ag = record.get("asset_group", "Unknown")
-            asset_classes[ac] = asset_classes.get(ac, 0) + 1
-            asset_groups[ag] = asset_groups.get(ag, 0) + 1
-        except Exception as e:
-            # Log or skip problematic keys
-            continue
-
+    # Counts are maintained by the loaders as they write (see redis_store.register_record)
+    aggregates = read_aggregates(redis_client)
     return jsonify({
-        "assetClasses": asset_classes,
-        "assetGroups": asset_groups
+        "assetClasses": aggregates["asset_class"],
+        "assetGroups": aggregates["asset_group"]
     })
 
 @app.route("/securities")
@@ -1,53 +1,33 @@
 from flask import Flask, render_template, request, jsonify
-import psycopg2
+import os
 import datetime
+from security_db import SecurityMasterDB
 
 app = Flask(__name__)
 
+# Pooled access to dummy_security_master; the DSN and pool size can be set from the environment
+app.config['POSTGRES_DSN'] = os.environ.get("POSTGRES_DSN", "dbname=postgres user=postgres password=postgres host=localhost port=5432")
+app.config['POSTGRES_POOL_SIZE'] = int(os.environ.get("POSTGRES_POOL_SIZE", 10))
+security_db = SecurityMasterDB(
+    app.config['POSTGRES_DSN'],
+    table_name="dummy_security_master",
+    key_fields=["FIGI", "CUSIP", "SEDOL", "ISIN", "COMPANY_NAME", "CURRENCY", "ASSET_CLASS", "ASSET_GROUP"],
+    date_field="APPLIED_DATE",
+    distinct_dates=False,
+    maxconn=app.config['POSTGRES_POOL_SIZE']
+)
+
 def get_latest_security_record(params):
     """
     Query Postgres for the latest record (by APPLIED_DATE) matching the given 8 key fields.
     """
-    fields = ["FIGI", "CUSIP", "SEDOL", "ISIN", "COMPANY_NAME", "CURRENCY", "ASSET_CLASS", "ASSET_GROUP"]
-    where_clause = " AND ".join([f'"{field}" = %s' for field in fields])
-    sql = f"""
-          SELECT * FROM dummy_security_master 
-          WHERE {where_clause} 
-          ORDER BY "APPLIED_DATE" DESC 
-          LIMIT 1;
-          """
-    values = [params.get(field, "") for field in fields]
-    conn = psycopg2.connect(dbname="postgres", user="postgres", password="postgres", host="localhost", port=5432)
-    cur = conn.cursor()
-    cur.execute(sql, values)
-    row = cur.fetchone()
-    colnames = [desc[0] for desc in cur.description] if row else []
-    conn.close()
-    if row:
-        return dict(zip(colnames, row))
-    else:
-        return {}
+    return security_db.get_latest_record(params)
 
 def get_all_security_versions(params):
     """
     Query Postgres for all versions of a security (matching the 8 key fields), ordered by APPLIED_DATE descending.
     """
-    fields = ["FIGI", "CUSIP", "SEDOL", "ISIN", "COMPANY_NAME", "CURRENCY", "ASSET_CLASS", "ASSET_GROUP"]
-    where_clause = " AND ".join([f'"{field}" = %s' for field in fields])
-    sql = f"""
-          SELECT * FROM dummy_security_master 
-          WHERE {where_clause} 
-          ORDER BY "APPLIED_DATE" DESC;
-          """
-    values = [params.get(field, "") for field in fields]
-    conn = psycopg2.connect(dbname="postgres", user="postgres", password="postgres", host="localhost", port=5432)
-    cur = conn.cursor()
-    cur.execute(sql, values)
-    rows = cur.fetchall()
-    colnames = [desc[0] for desc in cur.description]
-    conn.close()
-    records = [dict(zip(colnames, row)) for row in rows]
-    return records
+    return security_db.get_all_versions(params)
 
 @app.route("/security_detail")
 def security_detail():
@@ -0,0 +1,103 @@
+import argparse
+import json
+import random
+import string
+import time
+import check_digits
+from generate_soi import SOIGenerator
+
+# Cross-checks the table-driven check digits (check_digits.py), then times them. The published
+# algorithms are checked against genuine identifiers and a per-character implementation of
+# each, the SOI_* variants (for generated data) against the SOIGenerator methods. For every
+# identifier of both schemes it checks --samples random bodies (including lowercase letters,
+# and * @ # for CUSIP) and prints one JSON line with the number of mismatches and
+# identifiers/sec of the reference, the per-value validator and the column check. Exits with
+# status 1 if any check digit differs.
+#
+#   python bench_check_digits.py --samples 1000000
+
+ALNUM = string.ascii_uppercase + string.digits
+
+# Identifiers of listed securities (Apple, Microsoft, BAE Systems, ...).
+KNOWN = {
+    "FIGI": ["BBG000B9XRY4", "BBG000BLNNH6", "BBG000BPH459", "BBG000BVPV84"],
+    "CUSIP": ["037833100", "594918104", "38259P508", "17275R102"],
+    "SEDOL": ["0263494", "B0YBKJ7", "2046251", "B0WNLY7"],
+    "ISIN": ["US0378331005", "GB0002634946", "US5949181045", "AU0000XVGZA3", "DE000BAY0017"]
+}
+
+def _value(c):
+    return int(c) if c.isdigit() else {"*": 36, "@": 37, "#": 38}.get(c, ord(c.upper()) - ord("A") + 10)
+
+def _digit_sum(n):
+    return sum(int(d) for d in str(n))
+
+def reference_doubling(body):
+    """Published FIGI / CUSIP check digit: every second value doubled, the digits added."""
+    return str(-sum(_digit_sum(_value(c) * (2 if i % 2 else 1)) for i, c in enumerate(body)) % 10)
+
+def reference_sedol(body):
+    return str(-sum(_value(c) * w for c, w in zip(body, (1, 3, 1, 7, 3, 9))) % 10)
+
+def reference_isin(body):
+    """Published ISIN check digit: Luhn over the expanded digits, the rightmost doubled."""
+    digits = "".join(str(_value(c)) for c in body)[::-1]
+    return str(-sum(_digit_sum(int(d) * 2) if i % 2 == 0 else int(d) for i, d in enumerate(digits)) % 10)
+
+def random_bodies(kind, count):
+    """Identifier bodies (without the check digit) over the characters each algorithm accepts."""
+    if kind == "FIGI":
+        return ["BBG" + "".join(random.choices(ALNUM + string.ascii_lowercase, k=8)) for _ in range(count)]
+    if kind == "CUSIP":
+        return ["".join(random.choices(ALNUM + "*@#" + string.ascii_lowercase, k=8)) for _ in range(count)]
+    if kind == "SEDOL":
+        return ["".join(random.choices(ALNUM + string.ascii_lowercase, k=6)) for _ in range(count)]
+    return ["".join(random.choices(string.ascii_uppercase, k=2) + random.choices(ALNUM, k=9)) for _ in range(count)]
+
+def rate(count, func):
+    start = time.perf_counter()
+    func()
+    return round(count / (time.perf_counter() - start))
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-check and throughput of the table-driven check digits.")
+    parser.add_argument("--samples", type=int, default=1000000, help="random identifiers per type")
+    args = parser.parse_args()
+
+    soi = SOIGenerator()
+    checks = [
+        ("published", "FIGI", check_digits.FIGI, reference_doubling),
+        ("published", "CUSIP", check_digits.CUSIP, reference_doubling),
+        ("published", "SEDOL", check_digits.SEDOL, reference_sedol),
+        ("published", "ISIN", check_digits.ISIN, reference_isin),
+        ("soi", "FIGI", check_digits.SOI_FIGI, soi.compute_figi_check_digit),
+        ("soi", "CUSIP", check_digits.SOI_CUSIP, soi.compute_cusip_check_digit),
+        ("soi", "SEDOL", check_digits.SEDOL, soi.compute_sedol_check_digit),
+        ("soi", "ISIN", check_digits.SOI_ISIN, soi.compute_isin_check_digit),
+    ]
+    failed = False
+    for scheme, kind, identifier, compute in checks:
+        bodies = random_bodies(kind, args.samples)
+        expected = [compute(body) for body in bodies]
+        mismatches = sum(1 for body, digit in zip(bodies, expected) if identifier.check_digit(body) != digit)
+        values = [body + digit for body, digit in zip(bodies, expected)]
+        # Every value with a wrong check digit must be reported by both validators.
+        wrong = set(random.sample(range(len(values)), min(1000, len(values))))
+        for i in wrong:
+            values[i] = values[i][:-1] + str((int(values[i][-1]) + 1) % 10)
+        mismatches += sum(1 for i, value in enumerate(values) if identifier.valid(value) == (i in wrong))
+        mismatches += len(set(identifier.failures(values)) ^ wrong)
+        if scheme == "published":
+            mismatches += len(identifier.failures(KNOWN[kind]))
+        failed = failed or mismatches > 0
+        print(json.dumps({
+            "scheme": scheme, "identifier": kind, "samples": len(bodies), "mismatches": mismatches,
+            "reference_per_sec": rate(len(bodies), lambda: [compute(body) for body in bodies]),
+            "valid_per_sec": rate(len(values), lambda: [identifier.valid(value) for value in values]),
+            "column_per_sec": rate(len(values), lambda: identifier.failures(values))
+        }), flush=True)
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
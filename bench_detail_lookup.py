@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+import psycopg2
+from security_db import SecurityMasterDB, KEY_FIELDS, index_statements
+
+# Benchmarks the security detail lookups against a synthetic security_master-shaped table
+# of growing size, first as a plain heap and then with the indexes the loaders build.
+# Prints one JSON line per (table size, indexed) pair with lookup latencies in milliseconds.
+#
+#   python bench_detail_lookup.py --sizes 10000,100000,1000000
+
+def create_table(cur, table_name, num_rows, versions_per_security, num_dummy_fields):
+    """Creates `table_name` with `num_rows` rows: num_rows / versions_per_security securities."""
+    dummy_fields = [f"field_{i:04d}" for i in range(1, num_dummy_fields + 1)]
+    columns = KEY_FIELDS + dummy_fields + ["applied_date"]
+    cur.execute(f"DROP TABLE IF EXISTS {table_name};")
+    columns_sql = ", ".join([f'"{col}" TEXT' for col in columns])
+    cur.execute(f"CREATE TABLE {table_name} ({columns_sql});")
+    # Security s, version v: key fields derived from s, applied_date v days after 2025-01-01.
+    select = ", ".join([
+        "'BBG' || lpad(s::text, 9, '0')",
+        "lpad(s::text, 9, '0')",
+        "lpad((s % 10000000)::text, 7, '0')",
+        "'US' || lpad(s::text, 10, '0')",
+        "'Company ' || (s % 5000)",
+        "(ARRAY['USD','EUR','GBP','JPY','CHF'])[1 + s % 5]",
+        "(ARRAY['Equity','Fixed Income','Commodity','Real Estate','Cash','Derivatives'])[1 + s % 6]",
+        "'Group ' || (s % 20)",
+    ] + ["md5((s * 31 + v)::text)"] * num_dummy_fields + [
+        "to_char(date '2025-01-01' + v, 'YYYY-MM-DD')",
+    ])
+    num_securities = max(num_rows // versions_per_security, 1)
+    cur.execute(f"""
+        INSERT INTO {table_name}
+        SELECT {select}
+        FROM generate_series(0, {num_securities - 1}) AS s, generate_series(0, {versions_per_security - 1}) AS v;
+    """)
+    cur.execute(f"ANALYZE {table_name};")
+    return num_securities
+
+def security_params(s):
+    """The key field values create_table generated for security s."""
+    values = [
+        f"BBG{s:09d}", f"{s:09d}", f"{s % 10000000:07d}", f"US{s:010d}", f"Company {s % 5000}",
+        ["USD", "EUR", "GBP", "JPY", "CHF"][s % 5],
+        ["Equity", "Fixed Income", "Commodity", "Real Estate", "Cash", "Derivatives"][s % 6],
+        f"Group {s % 20}",
+    ]
+    return dict(zip(KEY_FIELDS, values))
+
+def time_lookups(db, securities):
+    """Returns per-lookup latencies (ms) of the detail page query and the by-date query."""
+    detail, by_date = [], []
+    for s in securities:
+        params = security_params(s)
+        start = time.perf_counter()
+        record, versions = db.get_security_detail(params)
+        detail.append((time.perf_counter() - start) * 1000)
+        assert versions, f"security {s} not found"
+        start = time.perf_counter()
+        db.get_record_by_date(params, record["applied_date"])
+        by_date.append((time.perf_counter() - start) * 1000)
+    return detail, by_date
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    return {
+        "mean_ms": round(statistics.mean(latencies), 3),
+        "p50_ms": round(latencies[len(latencies) // 2], 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Security detail lookup latency vs table size.")
+    parser.add_argument("--dsn", default=os.environ.get("POSTGRES_DSN", "dbname=postgres user=jez host=localhost port=5432"))
+    parser.add_argument("--table", default="bench_security_master")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="comma separated row counts")
+    parser.add_argument("--versions", type=int, default=5, help="versions per security")
+    parser.add_argument("--dummy-fields", type=int, default=20)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="keep the benchmark table afterwards")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    for size in [int(s) for s in args.sizes.split(",")]:
+        num_securities = create_table(cur, args.table, size, args.versions, args.dummy_fields)
+        securities = [random.randrange(num_securities) for _ in range(args.lookups)]
+        for indexed in (False, True):
+            if indexed:
+                start = time.perf_counter()
+                for statement in index_statements(args.table):
+                    cur.execute(statement)
+                index_build_s = round(time.perf_counter() - start, 3)
+            db = SecurityMasterDB(args.dsn, table_name=args.table, maxconn=1)
+            db.get_security_detail(security_params(securities[0]))  # prepare the statements
+            detail, by_date = time_lookups(db, securities)
+            db.close()
+            result = {"rows": size, "indexed": indexed, "lookups": args.lookups,
+                      "detail": summarize(detail), "by_date": summarize(by_date)}
+            if indexed:
+                result["index_build_s"] = index_build_s
+            print(json.dumps(result), flush=True)
+    if not args.keep:
+        cur.execute(f"DROP TABLE IF EXISTS {args.table};")
+    cur.close()
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Ingest throughput of the loader scripts on a synthetic inventory.
+# Generates soi.csv with SOIGenerator and one vendor file per --files with
+# SecurityMasterGeneratorFromSOI, maps them to the model layout with
+# generate_vendor_map.process_file, then runs each loader path in a fresh process against
+# the local Postgres and Redis. Prints one JSON line for the generation step and one per
+# loader with rows/sec, peak RSS and the time spent in each stage.
+#
+# The loaders flush Redis and recreate their tables (postgres_redis_uploader*.py use
+# security_master), so point this at scratch instances. The loaders' connection settings are
+# hardcoded; --pg / --redis override them for every connection, e.g.
+#
+#   python bench_ingest.py --rows 100000 --dummy-fields 50 --files 4 --pg "user=postgres password=postgres"
+
+LOADERS = ["postgres_redis_uploader", "postgres_redis_uploader_revised", "postgres_data_save", "postgres_data_store_save"]
+
+# Table used by the two postgres_data_* loaders, so the benchmark leaves dummy_security_master alone.
+BENCH_TABLE = "bench_dummy_security_master"
+
+def parse_settings(text):
+    """Parses "key=value key=value" connection overrides; port and db become ints."""
+    settings = {}
+    for item in (text or "").split():
+        key, _, value = item.partition("=")
+        settings[key] = int(value) if key in ("port", "db") else value
+    return settings
+
+def override_connections(pg_settings, redis_settings):
+    """
+    Applies the connection overrides to every psycopg2.connect / redis.Redis call of the loaders,
+    and to the shared pools of redis_store.get_client.
+    """
+    import psycopg2
+    import redis
+    if pg_settings:
+        connect = psycopg2.connect
+        def connect_with_overrides(*args, **kwargs):
+            return connect(*args, **dict(kwargs, **pg_settings))
+        psycopg2.connect = connect_with_overrides
+    if redis_settings:
+        class Redis(redis.Redis):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **dict(kwargs, **redis_settings))
+        redis.Redis = Redis
+        class ConnectionPool(redis.ConnectionPool):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **dict(kwargs, **redis_settings))
+        redis.ConnectionPool = ConnectionPool
+
+@contextlib.contextmanager
+def timed_stages(module, names, stages):
+    """Wraps module-level functions so each call adds its duration to stages[name]."""
+    originals = {name: getattr(module, name) for name in names}
+    def wrap(name, func):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stages[name] = round(stages.get(name, 0) + time.perf_counter() - start, 3)
+        return timed
+    for name, func in originals.items():
+        setattr(module, name, wrap(name, func))
+    try:
+        yield
+    finally:
+        for name, func in originals.items():
+            setattr(module, name, func)
+
+def generate_inventory(workdir, num_rows, num_files, num_dummy_fields):
+    """Writes store/ (vendor files) and inventory/ (model files) under workdir; returns the row count."""
+    from generate_soi import SOIGenerator
+    from generate_data import SecurityMasterGeneratorFromSOI
+    from generate_vendor_map import process_file
+    store_dir = os.path.join(workdir, "store")
+    inventory_dir = os.path.join(workdir, "inventory")
+    os.makedirs(store_dir)
+    os.makedirs(inventory_dir)
+    soi_filename = os.path.join(workdir, "soi.csv")
+    rows_per_file = num_rows // num_files
+    SOIGenerator().generate_csv(rows_per_file, soi_filename)
+    cwd = os.getcwd()
+    os.chdir(store_dir)  # generate_output writes <vendor>_<date>.csv to the working directory
+    try:
+        for i in range(num_files):
+            generator = SecurityMasterGeneratorFromSOI(soi_filename, f"bench{i}", num_dummy_fields, underscore_count=1)
+            generator.read_soi_file()
+            generator.generate_output()
+    finally:
+        os.chdir(cwd)
+    for filepath in glob.glob(os.path.join(store_dir, "*.csv")):
+        process_file(filepath, inventory_dir)
+    return rows_per_file * num_files
+
+def run_loader(name, workdir, pg_settings, stages):
+    """Runs one loader path on the data in workdir, the way its __main__ block does."""
+    os.chdir(workdir)
+    if name == "postgres_redis_uploader":
+        import postgres_redis_uploader as loader
+        names = ["clear_redis_keys", "drop_and_create_postgres_table", "load_inventory", "create_postgres_indexes",
+                 "swap_postgres_tables", "promote_staging_db"]
+        with timed_stages(loader, names, stages):
+            loader.main()
+    elif name == "postgres_redis_uploader_revised":
+        import postgres_redis_uploader_revised as loader
+        names = ["clear_redis_keys", "drop_and_create_postgres_table", "populate_postgres_table",
+                 "create_postgres_indexes", "load_inventory_to_redis", "bump_generation"]
+        with timed_stages(loader, names, stages):
+            loader.main()
+    elif name == "postgres_data_save":
+        from postgres_data_save import PostgresUploader
+        uploader = PostgresUploader(**dict(dict(dbname="postgres", user="postgres", password="postgres"), **pg_settings),
+                                    table_name=BENCH_TABLE)
+        drop_table(uploader.connection)
+        with timed_stages(uploader, ["create_table", "upload_csv", "create_indexes"], stages):
+            for filepath in sorted(glob.glob(os.path.join("store", "*.csv"))):
+                uploader.create_table(filepath)
+                uploader.upload_csv(filepath)
+            uploader.create_indexes()
+        uploader.close()
+    elif name == "postgres_data_store_save":
+        from postgres_data_store_save import StoreToPostgresUploader
+        uploader = StoreToPostgresUploader(folder="store", table_name=BENCH_TABLE)
+        drop_table(uploader.conn)
+        with timed_stages(uploader, ["upload_all_files", "create_indexes"], stages):
+            uploader.upload_all_files()
+            uploader.create_indexes()
+        uploader.close()
+    else:
+        raise ValueError(f"Unknown loader: {name}")
+
+def drop_table(conn):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE};")
+    conn.commit()
+
+def child(args):
+    """Runs a single loader in this process and prints its JSON result line."""
+    pg_settings, redis_settings = parse_settings(args.pg), parse_settings(args.redis)
+    override_connections(pg_settings, redis_settings)
+    stages = {}
+    start = time.perf_counter()
+    # The loaders report progress on stdout; keep it for the result line.
+    with contextlib.redirect_stdout(sys.stderr):
+        run_loader(args.child, args.workdir, pg_settings, stages)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"loader": args.child, "rows": args.total_rows, "seconds": round(elapsed, 3),
+                      "rows_per_sec": round(args.total_rows / elapsed),
+                      "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                      "stages": stages}), flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Rows/sec, peak RSS and stage timings of the inventory loaders.")
+    parser.add_argument("--rows", type=int, default=100000, help="total rows across all files")
+    parser.add_argument("--files", type=int, default=4, help="number of vendor files")
+    parser.add_argument("--dummy-fields", type=int, default=50)
+    parser.add_argument("--loaders", default=",".join(LOADERS), help="comma separated: " + ", ".join(LOADERS))
+    parser.add_argument("--pg", default="", help='psycopg2.connect overrides, e.g. "host=/tmp user=postgres"')
+    parser.add_argument("--redis", default="", help='redis.Redis overrides, e.g. "port=6380"')
+    parser.add_argument("--workdir", help="directory for the generated files (default: a temporary one)")
+    parser.add_argument("--keep", action="store_true", help="keep the generated files afterwards")
+    parser.add_argument("--verbose", action="store_true", help="show the loaders' own output")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--total-rows", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="bench_ingest_"))
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else open(os.devnull, "w")):
+            total_rows = generate_inventory(workdir, args.rows, args.files, args.dummy_fields)
+        print(json.dumps({"stage": "generate", "rows": total_rows, "files": args.files,
+                          "columns": 8 + args.dummy_fields + 1, "seconds": round(time.perf_counter() - start, 3),
+                          "workdir": workdir}), flush=True)
+        for name in args.loaders.split(","):
+            command = [sys.executable, os.path.abspath(__file__), "--child", name, "--workdir", workdir,
+                       "--total-rows", str(total_rows), "--pg", args.pg, "--redis", args.redis]
+            result = subprocess.run(command, stdout=subprocess.PIPE, text=True,
+                                    stderr=None if args.verbose else subprocess.DEVNULL,
+                                    cwd=os.path.dirname(os.path.abspath(__file__)))
+            if result.returncode != 0:
+                print(json.dumps({"loader": name, "error": f"exited with status {result.returncode}"}), flush=True)
+                continue
+            print(result.stdout.strip().splitlines()[-1], flush=True)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import csv
+import json
+import os
+import random
+import string
+import tempfile
+import time
+import psycopg2
+from pg_ingest import copy_csv_file, insert_csv_file, read_header
+
+# Compares the two Postgres ingest paths of the uploaders on one synthetic inventory file:
+# batched INSERTs (execute_batch, page_size=100) and COPY FROM STDIN.
+# Prints one JSON line per mode with rows/sec.
+#
+#   python bench_pg_ingest.py --rows 1000000
+
+KEY_FIELDS = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
+
+def write_inventory_file(filepath, num_rows, num_dummy_fields):
+    """Writes an inventory-shaped CSV (model column names) with random values."""
+    dummy_fields = [f"field_{i:04d}" for i in range(1, num_dummy_fields + 1)]
+    header = KEY_FIELDS + dummy_fields + ["applied_date"]
+    # A pool of random strings keeps generation fast enough for millions of rows.
+    pool = ["".join(random.choices(string.ascii_letters, k=10)) for _ in range(1000)] + [""] * 500
+    with open(filepath, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(header)
+        for i in range(num_rows):
+            keys = [f"BBG{i:09d}", f"{i:09d}", f"{i % 10000000:07d}", f"US{i:010d}",
+                    f"Company {i % 5000}", "USD", "Equity", "Domestic Equity"]
+            writer.writerow(keys + random.choices(pool, k=num_dummy_fields) + ["2025-02-16"])
+    return header
+
+def recreate_table(cur, table_name, header):
+    cur.execute(f"DROP TABLE IF EXISTS {table_name};")
+    columns_sql = ", ".join([f'"{col}" TEXT' for col in header])
+    cur.execute(f"CREATE TABLE {table_name} ({columns_sql});")
+
+def main():
+    parser = argparse.ArgumentParser(description="Rows/sec of batched INSERT vs COPY ingest.")
+    parser.add_argument("--dsn", default=os.environ.get("POSTGRES_DSN", "dbname=postgres user=jez host=localhost port=5432"))
+    parser.add_argument("--table", default="bench_ingest")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--dummy-fields", type=int, default=20)
+    parser.add_argument("--modes", default="insert,copy", help="comma separated: insert, copy")
+    parser.add_argument("--file", help="use this inventory CSV instead of generating one")
+    args = parser.parse_args()
+
+    if args.file:
+        filepath = args.file
+        header = read_header(filepath)
+    else:
+        fd, filepath = tempfile.mkstemp(suffix=".csv")
+        os.close(fd)
+        start = time.perf_counter()
+        header = write_inventory_file(filepath, args.rows, args.dummy_fields)
+        print(f"Generated {args.rows} rows in {time.perf_counter() - start:.1f}s: {filepath}")
+
+    conn = psycopg2.connect(args.dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        for mode in args.modes.split(","):
+            recreate_table(cur, args.table, header)
+            start = time.perf_counter()
+            if mode == "copy":
+                count = copy_csv_file(conn, filepath, args.table)
+            else:
+                count = insert_csv_file(conn, filepath, args.table, batch_size=100)
+            elapsed = time.perf_counter() - start
+            print(json.dumps({"mode": mode, "rows": count, "columns": len(header),
+                              "seconds": round(elapsed, 3), "rows_per_sec": round(count / elapsed)}), flush=True)
+        cur.execute(f"DROP TABLE IF EXISTS {args.table};")
+    finally:
+        cur.close()
+        conn.close()
+        if not args.file:
+            os.remove(filepath)
+
+if __name__ == "__main__":
+    main()
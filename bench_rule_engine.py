@@ -0,0 +1,159 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import random
+import re
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from check_digits import SOI_FAILURES
+from rule_engine import DEFAULT_CHUNK_SIZE, DEFAULT_RANGE_BYTES, PATTERNS, UNIQUE_KEY_FIELDS, RuleEngine, parallel_issues
+
+# Throughput of the rule engine (rule_engine.RuleEngine) on a synthetic inventory, against the
+# per-row loop it replaced in gen_x.py / gen_y.py. The inventory has the nine UniqueKey
+# columns; its identifiers are drawn from a pool of SOIGenerator rows (about 5% of them with
+# an empty or invalid field). Prints one JSON line for the generation step and one per
+# implementation with rows/sec and the number of issues found. The rule engine also verifies
+# check digits, which the former loop did not, but every generated identifier has a valid
+# one (by SOIGenerator's scheme, which the engine is given), so both must find the same issues.
+#
+# With --workers the parallel rule trace (rule_engine.parallel_issues) is timed for each
+# number of worker processes, with its speedup over the single-process engine. --awkward
+# adds rows that byte range splitting must not cut: quoted fields spanning lines, quotes
+# inside unquoted fields and blank lines; --line-terminator cr writes bare CR line endings.
+# Exits with status 1 if an implementation finds different issues.
+#
+#   python bench_rule_engine.py --rows 10000000
+#   python bench_rule_engine.py --input inventory/v_2025-02-10.csv --skip-legacy
+#   python bench_rule_engine.py --rows 2000000 --skip-legacy --workers 1 2 4 8
+#   python bench_rule_engine.py --rows 100000 --awkward --line-terminator cr --workers 2 --range-bytes 4096
+
+LINE_TERMINATORS = {"crlf": "\r\n", "lf": "\n", "cr": "\r"}
+
+def generate_inventory(filename, num_rows, pool_size=10000, awkward=False, line_terminator="\r\n"):
+    """
+    Writes num_rows synthetic inventory rows to filename. With awkward=True one row in 50 has
+    a quoted company name spanning two lines, one in 50 a quote inside an unquoted currency,
+    and a blank line follows one row in 50.
+    """
+    from generate_soi import SOIGenerator
+    soi = SOIGenerator()
+    pool = [soi.generate_row() for _ in range(pool_size)]
+    currencies = ["USD", "EUR", "GBP", "JPY"]
+    asset_classes = ["Equity", "Fixed Income", "Derivative"]
+    with open(filename, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f, lineterminator=line_terminator)
+        writer.writerow(UNIQUE_KEY_FIELDS)
+        for i in range(num_rows):
+            ids = pool[i % pool_size]
+            row = [ids["FIGI"], ids["CUSIP"], ids["SEDOL"], ids["ISIN"], f"Company {i % 5000}",
+                   random.choice(currencies), random.choice(asset_classes), "Group A", "2025-02-10"]
+            if awkward and i % 50 == 0:
+                row[4] = f'Company "{i % 5000}"\nHoldings'
+            if awkward and i % 50 == 25:
+                # csv.writer would quote this field; the reader takes the quote literally
+                row[5] = 'U"SD'
+                f.write(",".join(row) + line_terminator)
+                continue
+            writer.writerow(row)
+            if awkward and i % 50 == 10:
+                f.write(line_terminator)
+
+def legacy_issues(filename):
+    """The per-row check of the former gen_x/gen_y run_rule_engine, yielding its issues."""
+    with open(filename, newline="", encoding="utf-8") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row_index, row in enumerate(reader, start=1):
+            unique_key = (
+                row.get("FIGI", "") + "|" +
+                row.get("CUSIP", "") + "|" +
+                row.get("SEDOL", "") + "|" +
+                row.get("ISIN", "") + "|" +
+                row.get("COMPANY_NAME", "") + "|" +
+                row.get("CURRENCY", "") + "|" +
+                row.get("ASSET_CLASS", "") + "|" +
+                row.get("ASSET_GROUP", "") + "|" +
+                row.get("APPLIED_DATE", "")
+            )
+            for field, pattern in PATTERNS.items():
+                value = row.get(field, "")
+                if value.strip() == "":
+                    yield {"RowNumber": row_index, "UniqueKey": unique_key, "Field": field, "FieldValue": value,
+                           "Issue": "Warning", "Message": "Field is empty."}
+                elif not re.match(pattern, value):
+                    yield {"RowNumber": row_index, "UniqueKey": unique_key, "Field": field, "FieldValue": value,
+                           "Issue": "Error", "Message": f"Value does not match expected pattern for {field}."}
+
+def engine_issues(filename, chunk_size):
+    with open(filename, newline="", encoding="utf-8") as csvfile:
+        for _, issues in RuleEngine(check_digits=SOI_FAILURES).iter_issues(csv.reader(csvfile), chunk_size):
+            yield from issues
+
+def parallel_engine_issues(filename, workers, range_bytes, chunk_size):
+    with ProcessPoolExecutor(workers) as executor:
+        for _, issues in parallel_issues([filename], executor, 4 * workers, range_bytes, chunk_size, "soi"):
+            yield from issues
+
+def run(name, issues, num_rows):
+    """Consumes `issues`, returning the result line and a digest of the issues for comparison."""
+    start = time.perf_counter()
+    count = 0
+    digest = 0
+    for issue in issues:
+        count += 1
+        digest = hash((digest, issue["RowNumber"], issue["Field"], issue["Issue"], issue["UniqueKey"]))
+    elapsed = time.perf_counter() - start
+    return {"implementation": name, "rows": num_rows, "issues": count, "seconds": round(elapsed, 3),
+            "rows_per_sec": round(num_rows / elapsed)}, digest
+
+def main():
+    parser = argparse.ArgumentParser(description="Rows/sec of the rule engine against the former per-row check.")
+    parser.add_argument("--rows", type=int, default=10000000, help="rows of the synthetic inventory")
+    parser.add_argument("--input", help="check this inventory CSV instead of generating one")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--skip-legacy", action="store_true", help="do not time the former per-row check")
+    parser.add_argument("--workers", type=int, nargs="*", default=[], help="worker counts of the parallel rule trace")
+    parser.add_argument("--range-bytes", type=int, default=DEFAULT_RANGE_BYTES, help="bytes per parallel task")
+    parser.add_argument("--awkward", action="store_true", help="add multi-line, quoted and blank rows")
+    parser.add_argument("--line-terminator", choices=LINE_TERMINATORS, default="crlf")
+    parser.add_argument("--keep", action="store_true", help="keep the generated inventory afterwards")
+    args = parser.parse_args()
+
+    filename = args.input
+    if filename is None:
+        filename = os.path.join(tempfile.mkdtemp(prefix="bench_rule_engine_"), "inventory.csv")
+        start = time.perf_counter()
+        generate_inventory(filename, args.rows, awkward=args.awkward,
+                           line_terminator=LINE_TERMINATORS[args.line_terminator])
+        print(json.dumps({"stage": "generate", "rows": args.rows, "seconds": round(time.perf_counter() - start, 3),
+                          "file": filename, "size_mb": round(os.path.getsize(filename) / 2**20, 1)}), flush=True)
+    try:
+        with open(filename, newline="", encoding="utf-8") as f:
+            num_rows = sum(1 for row in itertools.islice(csv.reader(f), 1, None) if row)
+        engine_result, engine_digest = run("rule_engine", engine_issues(filename, args.chunk_size), num_rows)
+        print(json.dumps(engine_result), flush=True)
+        same = True
+        if not args.skip_legacy:
+            result, legacy_digest = run("legacy", legacy_issues(filename), num_rows)
+            result["same_issues"] = legacy_digest == engine_digest
+            same = same and result["same_issues"]
+            print(json.dumps(result), flush=True)
+        for workers in args.workers:
+            issues = parallel_engine_issues(filename, workers, args.range_bytes, args.chunk_size)
+            result, parallel_digest = run("parallel", issues, num_rows)
+            result["workers"] = workers
+            result["speedup"] = round(engine_result["seconds"] / result["seconds"], 2)
+            result["same_issues"] = parallel_digest == engine_digest
+            same = same and result["same_issues"]
+            print(json.dumps(result), flush=True)
+    finally:
+        if args.input is None and not args.keep:
+            os.remove(filename)
+            os.rmdir(os.path.dirname(filename))
+    if not same:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
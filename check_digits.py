@@ -0,0 +1,225 @@
+"""
+Table-driven check digits of FIGI, CUSIP, SEDOL and ISIN identifiers.
+
+FIGI, CUSIP, SEDOL and ISIN follow the published algorithms, so genuine identifiers (e.g.
+BBG000B9XRY4, 037833100, 0263494, US0378331005) pass. The identifiers generated by
+SOIGenerator (generate_soi.py) use variants of the FIGI, CUSIP and ISIN algorithms; SOI_FIGI,
+SOI_CUSIP and SOI_ISIN compute those, for checking generated data only (the rule traces of
+gen_x.py and gen_y.py). Character values come from 256-entry tables applied with
+bytes.translate instead of per-character int()/ord() branching. bench_check_digits.py
+cross-checks the published algorithms against known identifiers and a per-character
+reference, and the SOI_* ones against the SOIGenerator methods.
+
+The *_check_digit functions take the identifier without its check digit and valid_* the
+whole identifier. FAILURES (and SOI_FAILURES) holds, per rule engine field, the check of a
+whole column of identifiers at once:
+the identifiers are joined into one byte string, each character position is translated to
+its (mod 10) weighted value, and the positions are added up as big integers holding one
+identifier per byte, so the per-identifier work runs in C.
+"""
+
+import string
+
+def _char_value(c):
+    """Value of an identifier character: 0-9 for digits, 10-35 for letters A-Z (either case)."""
+    if c in string.digits:
+        return int(c)
+    if c in string.ascii_letters:
+        return ord(c.upper()) - ord("A") + 10
+    return None
+
+def _soi_figi_value(c):
+    # Letters count from ord("A") without upper-casing, as in SOIGenerator.compute_figi_check_digit.
+    if c in string.digits:
+        return int(c)
+    if c in string.ascii_letters:
+        return ord(c) - ord("A") + 10
+    return None
+
+def _cusip_value(c):
+    return {"*": 36, "@": 37, "#": 38}.get(c, _char_value(c))
+
+def _digit_sum(n):
+    return sum(int(d) for d in str(n))
+
+def _luhn_double(d):
+    return 2 * d - 9 if d > 4 else 2 * d
+
+def _table(value):
+    """Translation table mapping each byte to value(character) mod 10, or 0 where that is None."""
+    return bytes((value(chr(b)) or 0) % 10 for b in range(256))
+
+def _weighted(value, weight, reduce=lambda p: p):
+    """Table of reduce(value(c) * weight)."""
+    def product(c):
+        v = value(c)
+        return None if v is None else reduce(v * weight)
+    return _table(product)
+
+# Table of each character position of the identifier body; the check digit follows the body.
+# FIGI and CUSIP: every second character's value is doubled and the digits of the products added.
+_FIGI = [_weighted(_char_value, 1, _digit_sum), _weighted(_char_value, 2, _digit_sum)]
+_CUSIP = [_weighted(_cusip_value, 1, _digit_sum), _weighted(_cusip_value, 2, _digit_sum)]
+# SOIGenerator's FIGI is the sum of the character values, and its CUSIP takes 9 off a product
+# above 9 instead of adding its digits (which differs for products above 18).
+_SOI_FIGI = [_table(_soi_figi_value)]
+_SOI_CUSIP = [_weighted(_cusip_value, weight, lambda p: p - 9 if p > 9 else p) for weight in (1, 2)]
+# SEDOL: weights 1, 3, 1, 7, 3, 9 (the same in SOIGenerator).
+_SEDOL = [_weighted(_char_value, weight) for weight in (1, 3, 1, 7, 3, 9)]
+# ISIN: letters are expanded to their two-digit values, then every second digit from the right
+# is doubled, starting with the rightmost (SOIGenerator starts with the second). A character's
+# contribution depends on the parity of the number of digits to its right.
+def _isin_contribution(c, parity):
+    v = _char_value(c)
+    if v is None:
+        return None
+    digits = [int(d) for d in reversed(str(v))]
+    return sum(_luhn_double(d) if (parity + i) % 2 else d for i, d in enumerate(digits))
+_ISIN_DIGITS_EVEN = _table(lambda c: _isin_contribution(c, 0))  # the rightmost digit is kept
+_ISIN_DIGITS_ODD = _table(lambda c: _isin_contribution(c, 1))   # the rightmost digit is doubled
+# (table when an even number of digits follows, table when an odd number does)
+_ISIN = (_ISIN_DIGITS_ODD, _ISIN_DIGITS_EVEN)
+_SOI_ISIN = (_ISIN_DIGITS_EVEN, _ISIN_DIGITS_ODD)
+# 0xFF for digits (which flip the parity of the characters to their left), 0 for letters.
+_ISIN_FLIP = bytes(0xFF if chr(b) in string.digits else 0 for b in range(256))
+
+# Check digit characters by body total: the total mod 10 for SOIGenerator's FIGI, its
+# complement otherwise.
+_SOI_FIGI_CHECK = bytes(ord(str(total % 10)) for total in range(256))
+_COMPLEMENT_CHECK = bytes(ord(str(-total % 10)) for total in range(256))
+
+def _position_totals(blob, length, tables):
+    """
+    Per identifier (one byte each), the sum of its body characters' table values. `tables`
+    repeats over the body (e.g. [odd positions, even positions]).
+    """
+    total = 0
+    for position in range(length - 1):
+        table = tables[position % len(tables)]
+        total += int.from_bytes(blob[position::length].translate(table), "little")
+    return total.to_bytes(len(blob) // length, "little")
+
+def _isin_totals(blob, length, tables):
+    even_table, odd_table = tables
+    count = len(blob) // length
+    every = int.from_bytes(b"\xff" * count, "little")
+    odd = 0  # 0xFF for the identifiers in which an odd number of digits follows the character
+    total = 0
+    for position in range(length - 2, -1, -1):
+        column = blob[position::length]
+        even_values = int.from_bytes(column.translate(even_table), "little")
+        odd_values = int.from_bytes(column.translate(odd_table), "little")
+        total += (even_values & (odd ^ every)) | (odd_values & odd)
+        odd ^= int.from_bytes(column.translate(_ISIN_FLIP), "little")
+    return total.to_bytes(count, "little")
+
+# Single identifiers: the same tables, applied to the body directly.
+_ISIN_EXPAND = str.maketrans({c: str(_char_value(c)) for c in string.ascii_letters})
+_DIGIT = _table(lambda c: int(c) if c in string.digits else None)
+_DOUBLED = _table(lambda c: _luhn_double(int(c)) if c in string.digits else None)
+
+def _body_total(body, tables):
+    body = body.encode("ascii")
+    step = len(tables)
+    return sum(sum(body[i::step].translate(table)) for i, table in enumerate(tables))
+
+def _sedol_total(body):
+    body = body.encode("ascii")
+    # Positions 0 and 2 have weight 1, 1 and 4 weight 3, 3 weight 7 and 5 weight 9.
+    return (sum(body[0:3:2].translate(_SEDOL[0])) + sum(body[1:5:3].translate(_SEDOL[1]))
+            + sum(body[3:4].translate(_SEDOL[3])) + sum(body[5:6].translate(_SEDOL[5])))
+
+def _isin_total(body, rightmost_doubled=True):
+    digits = body.translate(_ISIN_EXPAND).encode("ascii")[::-1]
+    doubled, kept = (digits[0::2], digits[1::2]) if rightmost_doubled else (digits[1::2], digits[0::2])
+    return sum(kept.translate(_DIGIT)) + sum(doubled.translate(_DOUBLED))
+
+def figi_check_digit(figi_without_check):
+    return chr(_COMPLEMENT_CHECK[_body_total(figi_without_check, _FIGI) % 10])
+
+def cusip_check_digit(cusip_without_check):
+    return chr(_COMPLEMENT_CHECK[_body_total(cusip_without_check, _CUSIP) % 10])
+
+def sedol_check_digit(sedol_without_check):
+    return chr(_COMPLEMENT_CHECK[_sedol_total(sedol_without_check) % 10])
+
+def isin_check_digit(isin_without_check):
+    return chr(_COMPLEMENT_CHECK[_isin_total(isin_without_check) % 10])
+
+def soi_figi_check_digit(figi_without_check):
+    return chr(_SOI_FIGI_CHECK[_body_total(figi_without_check, _SOI_FIGI) % 10])
+
+def soi_cusip_check_digit(cusip_without_check):
+    return chr(_COMPLEMENT_CHECK[_body_total(cusip_without_check, _SOI_CUSIP) % 10])
+
+def soi_isin_check_digit(isin_without_check):
+    return chr(_COMPLEMENT_CHECK[_isin_total(isin_without_check, rightmost_doubled=False) % 10])
+
+class _Identifier:
+    """Check digit of one identifier type: body totals by position, then the check table."""
+    def __init__(self, length, tables, totals, check_table, check_digit):
+        self.length = length
+        self.tables = tables
+        self.totals = totals
+        self.check_table = check_table
+        self.check_digit = check_digit
+        # Stands in for values that are left out of a column check.
+        self.placeholder = "0" * (length - 1) + check_digit("0" * (length - 1))
+
+    def valid(self, value):
+        if len(value) != self.length or not value.isascii():
+            return False
+        return self.check_digit(value[:-1]) == value[-1]
+
+    def failures(self, values, skip=()):
+        """
+        Positions in `values` whose check digit is wrong, leaving out the positions in `skip`.
+        The other values are expected to match the identifier's pattern.
+        """
+        if skip:
+            values = list(values)
+            for i in skip:
+                values[i] = self.placeholder
+        blob = "".join(values)
+        if len(blob) != self.length * len(values) or not blob.isascii():
+            # Not all of the expected length (e.g. a trailing newline): check them one by one.
+            return [i for i, value in enumerate(values) if i not in skip and not self.valid(value)]
+        blob = blob.encode("ascii")
+        expected = self.totals(blob, self.length, self.tables).translate(self.check_table)
+        actual = blob[self.length - 1::self.length]
+        if expected == actual:
+            return []
+        return [i for i, (a, b) in enumerate(zip(expected, actual)) if a != b]
+
+FIGI = _Identifier(12, _FIGI, _position_totals, _COMPLEMENT_CHECK, figi_check_digit)
+CUSIP = _Identifier(9, _CUSIP, _position_totals, _COMPLEMENT_CHECK, cusip_check_digit)
+SEDOL = _Identifier(7, _SEDOL, _position_totals, _COMPLEMENT_CHECK, sedol_check_digit)
+ISIN = _Identifier(12, _ISIN, _isin_totals, _COMPLEMENT_CHECK, isin_check_digit)
+
+SOI_FIGI = _Identifier(12, _SOI_FIGI, _position_totals, _SOI_FIGI_CHECK, soi_figi_check_digit)
+SOI_CUSIP = _Identifier(9, _SOI_CUSIP, _position_totals, _COMPLEMENT_CHECK, soi_cusip_check_digit)
+SOI_ISIN = _Identifier(12, _SOI_ISIN, _isin_totals, _COMPLEMENT_CHECK, soi_isin_check_digit)
+
+valid_figi = FIGI.valid
+valid_cusip = CUSIP.valid
+valid_sedol = SEDOL.valid
+valid_isin = ISIN.valid
+
+# Column check of each rule engine field: failures(values, skip) -> positions with a wrong check digit.
+FAILURES = {
+    "FIGI": FIGI.failures,
+    "CUSIP": CUSIP.failures,
+    "SEDOL": SEDOL.failures,
+    "ISIN": ISIN.failures
+}
+
+# The same for data generated by SOIGenerator.
+SOI_FAILURES = {
+    "FIGI": SOI_FIGI.failures,
+    "CUSIP": SOI_CUSIP.failures,
+    "SEDOL": SEDOL.failures,
+    "ISIN": SOI_ISIN.failures
+}
+
+# Check digit schemes by name, for code that can only pass a name (e.g. to worker processes).
+SCHEMES = {"published": FAILURES, "soi": SOI_FAILURES}
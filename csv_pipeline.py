@@ -0,0 +1,177 @@
+"""
+Streaming CSV helpers for the loaders and generators: read -> map -> batch -> write,
+holding at most a bounded number of rows in memory whatever the file size.
+"""
+
+import csv
+import os
+import queue
+import threading
+
+def read_fieldnames(filepath):
+    """Returns the header of a CSV file."""
+    with open(filepath, newline="", encoding="utf-8") as csvfile:
+        return csv.DictReader(csvfile).fieldnames or []
+
+def read_rows(filepath):
+    """Yields the rows of a CSV file as dicts, one at a time."""
+    with open(filepath, newline="", encoding="utf-8") as csvfile:
+        yield from csv.DictReader(csvfile)
+
+def batched(rows, batch_size):
+    """Groups an iterable of rows into lists of at most batch_size rows."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+_DONE = object()
+
+def write_batches(batches, write_batch, max_pending=4):
+    """
+    Calls write_batch(batch) for every batch and returns the number of rows written.
+    Batches are produced (read and mapped) on a background thread while the previous ones
+    are written, with at most max_pending batches buffered in between: a slow sink makes
+    the reader wait rather than letting rows pile up in memory.
+    """
+    buffer = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for batch in batches:
+                while not stop.is_set():
+                    try:
+                        buffer.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+        except Exception as e:
+            errors.append(e)
+        finally:
+            buffer.put(_DONE)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
+    count = 0
+    try:
+        while True:
+            batch = buffer.get()
+            if batch is _DONE:
+                break
+            write_batch(batch)
+            count += len(batch)
+    finally:
+        # If the writer failed, release the producer and let it finish.
+        stop.set()
+        while producer.is_alive():
+            try:
+                buffer.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        producer.join()
+    if errors:
+        raise errors[0]
+    return count
+
+def fan_out(batches, sinks, max_pending=4):
+    """
+    Feeds every batch to each sink in `sinks` ({name: write_batch}), parsing the input once.
+    Each sink writes on its own thread behind a queue of at most max_pending batches, so the
+    sinks run concurrently and the reader only waits for the slowest one.
+
+    Returns {name: {"rows": rows acknowledged, "error": exception or None}}. A sink that
+    fails stops receiving batches while the others carry on; errors raised while reading
+    the batches are re-raised once every sink has finished.
+    """
+    results = {name: {"rows": 0, "error": None} for name in sinks}
+    queues = {name: queue.Queue(maxsize=max_pending) for name in sinks}
+
+    def consume(name, write_batch):
+        result = results[name]
+        while True:
+            batch = queues[name].get()
+            if batch is _DONE:
+                return
+            if result["error"] is not None:
+                continue  # keep draining so the reader never blocks on a failed sink
+            try:
+                write_batch(batch)
+                result["rows"] += len(batch)
+            except Exception as e:
+                result["error"] = e
+
+    threads = [threading.Thread(target=consume, args=(name, write_batch), daemon=True)
+               for name, write_batch in sinks.items()]
+    for thread in threads:
+        thread.start()
+    try:
+        for batch in batches:
+            live = [name for name in sinks if results[name]["error"] is None]
+            if not live:
+                break
+            for name in live:
+                queues[name].put(batch)
+    finally:
+        for name in sinks:
+            queues[name].put(_DONE)
+        for thread in threads:
+            thread.join()
+    return results
+
+class CsvRowOverlay:
+    """
+    Row-indexed view of a CSV file for the daily simulators. The file stays on disk;
+    only rows that have been replaced are kept in memory, so memory grows with the
+    number of modified rows rather than with the file size.
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.fieldnames = read_fieldnames(filepath)
+        self.overrides = {}
+        self._length = sum(1 for _ in read_rows(filepath))
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        """Yields every row in file order, with replaced rows substituted."""
+        for idx, row in enumerate(read_rows(self.filepath)):
+            yield self.overrides.get(idx, row)
+
+    def __setitem__(self, idx, row):
+        self.overrides[idx] = row
+
+    def fetch(self, indices):
+        """Returns {idx: row} for the given row indices, in one pass over the file."""
+        wanted = set(indices)
+        rows = {idx: self.overrides[idx] for idx in wanted if idx in self.overrides}
+        missing = wanted - rows.keys()
+        if missing:
+            last = max(missing)
+            for idx, row in enumerate(read_rows(self.filepath)):
+                if idx in missing:
+                    rows[idx] = row
+                if idx >= last:
+                    break
+        return rows
+
+    def save(self, output_filename):
+        """
+        Writes the current rows to output_filename. The file is written next to its final
+        name and then moved into place, so saving over the source file is safe.
+        """
+        tmp_filename = output_filename + ".tmp"
+        with open(tmp_filename, "w", newline="", encoding="utf-8") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames)
+            writer.writeheader()
+            for row in self:
+                writer.writerow(row)
+        os.replace(tmp_filename, output_filename)
@@ -4,18 +4,19 @@ import os
 import datetime
 import random
 import psycopg2
-import psycopg2.extras
-import redis
 import time
 import json
 from os import cpu_count
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from security_db import index_statements, swap_statements
+from pg_ingest import ingest_csv_file
+from redis_store import RecordWriter, get_client, promote_staging_db, index_rule_trace_issue, DEFAULT_BATCH_SIZE
 
 # ---------- Redis Operations ----------
 
-def clear_redis_keys():
-    """Clears all keys in Redis."""
-    r = redis.Redis(host="localhost", port=6379, db=0)
+def clear_redis_keys(db=0):
+    """Clears all keys in a Redis db."""
+    r = get_client(db=db)
     r.flushdb()
     print("Redis keys cleared.")
 
@@ -40,43 +41,48 @@ def drop_and_create_postgres_table(model_columns, table_name="security_master"):
     cur.close()
     conn.close()
 
-def populate_postgres_table_for_file(filepath, table_name="security_master", batch_size=100):
+def populate_postgres_table_for_file(filepath, table_name="security_master", batch_size=100, use_copy=True):
     """
-    Processes one CSV file from the inventory directory and inserts its rows into the Postgres table.
-    Uses psycopg2.extras.execute_batch to insert rows in batches.
+    Processes one CSV file from the inventory directory and loads its rows into the Postgres table.
+    Streams the file through COPY FROM STDIN; with use_copy=False (or if COPY fails) rows are
+    inserted with psycopg2.extras.execute_batch instead.
     """
     conn = psycopg2.connect(dbname="postgres", user="jez", password="", host="localhost", port=5432)
     conn.autocommit = True
-    cur = conn.cursor()
-    
-    with open(filepath, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        headers = reader.fieldnames
-        rows = list(reader)
-    
-    if not rows:
-        print(f"No rows found in {filepath}")
-        cur.close()
+    try:
+        count = ingest_csv_file(conn, filepath, table_name, batch_size=batch_size, use_copy=use_copy)
+    finally:
         conn.close()
-        return 0
-
-    columns = [f'"{col}"' for col in headers]
-    columns_sql = ', '.join(columns)
-    placeholders = ', '.join(['%s'] * len(headers))
-    insert_sql = f"INSERT INTO {table_name} ({columns_sql}) VALUES ({placeholders});"
-    
-    # Create a list of value tuples
-    values_list = [[row[col] for col in headers] for row in rows]
-    
-    # Use execute_batch for better performance
-    psycopg2.extras.execute_batch(cur, insert_sql, values_list, page_size=batch_size)
-    count = len(values_list)
     
     print(f"Inserted {count} records from {os.path.basename(filepath)} into Postgres table '{table_name}'.")
-    
+    return count
+
+def create_postgres_indexes(table_name="security_master"):
+    """
+    Builds the lookup indexes on the Postgres table. Called once the bulk load is done,
+    since maintaining the indexes row by row during the load is much slower.
+    """
+    conn = psycopg2.connect(dbname="postgres", user="jez", password="", host="localhost", port=5432)
+    conn.autocommit = True
+    cur = conn.cursor()
+    for statement in index_statements(table_name):
+        cur.execute(statement)
+    print(f"Postgres indexes created on '{table_name}'.")
     cur.close()
     conn.close()
-    return count
+
+def swap_postgres_tables(table_name="security_master", staging_table="security_master_staging"):
+    """
+    Replaces the live table with the loaded and indexed staging table in one transaction.
+    """
+    conn = psycopg2.connect(dbname="postgres", user="jez", password="", host="localhost", port=5432)
+    try:
+        with conn, conn.cursor() as cur:
+            for statement in swap_statements(table_name, staging_table):
+                cur.execute(statement)
+    finally:
+        conn.close()
+    print(f"Postgres table '{staging_table}' swapped in as '{table_name}'.")
 
 def populate_postgres_table(inventory_dir, table_name="security_master"):
     """
@@ -89,46 +95,48 @@ def populate_postgres_table(inventory_dir, table_name="security_master"):
         return
     
     total_inserted = 0
+    failed_files = []
     with ThreadPoolExecutor(max_workers=cpu_count()) as executor:
-        futures = [executor.submit(populate_postgres_table_for_file, filepath, table_name) for filepath in files]
+        futures = {executor.submit(populate_postgres_table_for_file, filepath, table_name): filepath for filepath in files}
         for future in as_completed(futures):
-            total_inserted += future.result()
+            try:
+                total_inserted += future.result()
+            except Exception as e:
+                print(f"Failed to load {os.path.basename(futures[future])} into Postgres: {e}")
+                failed_files.append(futures[future])
     print(f"Total inserted records into Postgres table '{table_name}': {total_inserted}")
+    if failed_files:
+        print(f"{len(failed_files)} file(s) failed to load: {sorted(failed_files)}")
+    return failed_files
 
 # ---------- CSV Loader to Redis ----------
 
-def load_inventory_file_to_redis(filepath, key_fields):
+def load_inventory_file_to_redis(filepath, key_fields, redis_db=0):
     """
     Loads one CSV file from the inventory directory into Redis.
     For each row, constructs a key using the first 8 columns (key_fields).
-    Uses a Redis pipeline for better performance.
+    Uses adaptively sized Redis pipelines on the shared connection pool (see redis_store.RecordWriter).
     """
-    r = redis.Redis(host="localhost", port=6379, db=0)
-    count = 0
-    with open(filepath, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        pipe = r.pipeline()
+    def keyed_rows(reader):
         for row in reader:
             key_values = [row.get(field, "").strip() for field in key_fields]
             if any(v == "" for v in key_values):
                 key = f"record:{os.path.basename(filepath)}:{random.randint(100000,999999)}"
             else:
                 key = "|".join(key_values)
-            # Store the entire row as a hash
-            pipe.hset(key, mapping=row)
-            count += 1
-            # Execute in batches of 100 commands
-            if count % 100 == 0:
-                pipe.execute()
-        pipe.execute()
+            yield key, row
+
+    with open(filepath, newline="", encoding="utf-8") as csvfile:
+        # Store the entire row as a hash, register it for paging (counting it on the
+        # dashboard) and add it to the asset_class/asset_group/currency indexes
+        count = RecordWriter(get_client(db=redis_db)).write(keyed_rows(csv.DictReader(csvfile)))
     print(f"Loaded {count} records from {os.path.basename(filepath)} into Redis.")
     return count
 
-def load_inventory_to_redis(inventory_dir):
+def load_inventory_to_redis(inventory_dir, redis_db=0):
     """
     Iterates over all CSV files in the inventory directory and loads each row into Redis concurrently.
     """
-    r = redis.Redis(host="localhost", port=6379, db=0)
     files = glob.glob(os.path.join(inventory_dir, "*.csv"))
     if not files:
         print(f"No CSV files found in directory '{inventory_dir}'.")
@@ -137,45 +145,52 @@ def load_inventory_to_redis(inventory_dir):
     key_fields = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
     total_loaded = 0
     with ThreadPoolExecutor(max_workers=cpu_count()) as executor:
-        futures = [executor.submit(load_inventory_file_to_redis, filepath, key_fields) for filepath in files]
+        futures = [executor.submit(load_inventory_file_to_redis, filepath, key_fields, redis_db) for filepath in files]
         for future in as_completed(futures):
             total_loaded += future.result()
     print(f"Total loaded records into Redis: {total_loaded}")
 
 # ---------- New: Load Rule Trace to Redis ----------
 
-def load_rule_trace_to_redis(rule_trace_dir):
+def load_rule_trace_to_redis(rule_trace_dir, batch_size=DEFAULT_BATCH_SIZE, redis_db=0):
     """
     Iterates over all CSV files in the rule_trace directory.
-    For each CSV file, reads each row (error/warning record) and pushes it as a JSON string
-    into a Redis list with key "rule_trace".
+    Each row (error/warning record) is pushed as a JSON string onto the issue list of its
+    security and the security is added to the set of its applied date, so the issues of one
+    security can be read without scanning the others. The pipeline is flushed every
+    batch_size rows. RPUSH is not idempotent, so the pipelines are sent without retries.
     """
-    r = redis.Redis(host="localhost", port=6379, db=0)
+    r = get_client(db=redis_db, idempotent=False)
     files = glob.glob(os.path.join(rule_trace_dir, "*.csv"))
     if not files:
         print(f"No CSV files found in directory '{rule_trace_dir}'.")
         return
     total = 0
-    pipe = r.pipeline()
+    pipe = r.pipeline(transaction=False)
     for filepath in files:
         with open(filepath, newline="", encoding="utf-8") as csvfile:
             reader = csv.DictReader(csvfile)
             for row in reader:
-                # Each row should have a UniqueKey field (from the rule engine report)
-                unique_key = row.get("UniqueKey", "")
-                # We push the entire record as JSON into a list stored under key "rule_trace"
-                pipe.rpush("rule_trace", json.dumps(row))
+                # Each row has a UniqueKey field (from the rule engine report)
+                index_rule_trace_issue(pipe, row)
                 total += 1
+                if total % batch_size == 0:
+                    pipe.execute()
     pipe.execute()
-    print(f"Loaded {total} rule trace records into Redis under key 'rule_trace'.")
+    print(f"Loaded {total} rule trace records into Redis, indexed by security and date.")
 
 # ---------- Main Function ----------
 
+# A full reload is built in these and swapped in once complete, so the app keeps serving
+# the previous data set until then.
+STAGING_TABLE = "security_master_staging"
+STAGING_REDIS_DB = 1
+
 def main():
     inventory_dir = "inventory"  # Directory containing model CSV files.
     
-    # Step 1: Clear Redis keys.
-    clear_redis_keys()
+    # Step 1: Clear the staging Redis db.
+    clear_redis_keys(db=STAGING_REDIS_DB)
     
     # Step 2: Process the first CSV in the inventory directory to obtain model columns.
     files = glob.glob(os.path.join(inventory_dir, "*.csv"))
@@ -187,18 +202,29 @@ def main():
         model_columns = reader.fieldnames
     print("Model columns detected:", model_columns)
     
-    # Step 3: Drop and create the Postgres table.
-    drop_and_create_postgres_table(model_columns, table_name="security_master")
+    # Step 3: Drop and create the staging table.
+    drop_and_create_postgres_table(model_columns, table_name=STAGING_TABLE)
     
-    # Step 4: Populate the Postgres table with data from all CSV files in inventory concurrently.
-    populate_postgres_table(inventory_dir, table_name="security_master")
+    # Step 4: Populate the staging table with data from all CSV files in inventory concurrently.
+    failed_files = populate_postgres_table(inventory_dir, table_name=STAGING_TABLE)
+    if failed_files:
+        print("Some files failed to load; keeping the current data live. Staging data left in place for inspection.")
+        return
+    
+    # Step 4b: Build the lookup indexes now that the bulk load is done.
+    create_postgres_indexes(table_name=STAGING_TABLE)
     
-    # Step 5: Load inventory files into Redis concurrently.
-    load_inventory_to_redis(inventory_dir)
+    # Step 5: Load inventory files into the staging Redis db concurrently.
+    load_inventory_to_redis(inventory_dir, redis_db=STAGING_REDIS_DB)
     
-    # New Step 6: Load rule trace files from the rule_trace directory into Redis.
+    # New Step 6: Load rule trace files from the rule_trace directory into the staging Redis db.
     rule_trace_dir = "rule_trace"
-    load_rule_trace_to_redis(rule_trace_dir)
+    load_rule_trace_to_redis(rule_trace_dir, redis_db=STAGING_REDIS_DB)
+    
+    # Step 7: Swap the staging table and Redis db in. The Redis swap carries a new load
+    # generation, so the app drops its cached responses.
+    swap_postgres_tables("security_master", STAGING_TABLE)
+    promote_staging_db(get_client(db=STAGING_REDIS_DB), STAGING_REDIS_DB, live_db=0)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -3,8 +3,10 @@ import random
 import string
 import datetime
 import os
-import re
 from faker import Faker
+from csv_pipeline import read_fieldnames, read_rows
+from check_digits import SOI_FAILURES
+from rule_engine import RuleEngine, run_rule_engine
 
 fake = Faker()
 
@@ -54,17 +56,14 @@ class SecurityMasterGeneratorFromSOI:
         self.num_dummy_fields = num_dummy_fields
         self.underscore_count = underscore_count
         self.soi_fixed_fields = []  # Expected fixed fields from soi.csv (should be 4: FIGI, CUSIP, SEDOL, ISIN)
-        self.rows = []              # Rows read from soi.csv
+        self.num_rows = 0           # Rows written by generate_output (soi.csv is streamed, not held in memory)
         # Dictionary mapping (asset_class, asset_group) to a set of dummy field base names to leave empty.
         self.empty_pattern = {}
 
     def read_soi_file(self):
-        """Reads the soi.csv file and stores its fixed fields and rows."""
-        with open(self.soi_filename, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            self.soi_fixed_fields = reader.fieldnames  # Expected to be 4 columns.
-            self.rows = list(reader)
-        print(f"Loaded {len(self.rows)} rows from {self.soi_filename} with fixed fields: {self.soi_fixed_fields}")
+        """Reads the fixed fields of soi.csv; its rows are streamed by generate_output."""
+        self.soi_fixed_fields = read_fieldnames(self.soi_filename)
+        print(f"Reading rows from {self.soi_filename} with fixed fields: {self.soi_fixed_fields}")
 
     def generate_output(self):
         """
@@ -102,7 +101,9 @@ class SecurityMasterGeneratorFromSOI:
         with open(output_filename, "w", newline="", encoding="utf-8") as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=output_headers)
             writer.writeheader()
-            for fixed_row in self.rows:
+            self.num_rows = 0
+            for fixed_row in read_rows(self.soi_filename):
+                self.num_rows += 1
                 new_row = {}
                 # 1. Copy fixed fields from soi.csv.
                 for field in fixed:
@@ -139,7 +140,7 @@ class SecurityMasterGeneratorFromSOI:
                 # 4. Set APPLIED_DATE.
                 new_row["APPLIED_DATE"] = current_date
                 writer.writerow(new_row)
-        print(f"Output file '{output_filename}' generated with {len(self.rows)} rows and {len(output_headers)} columns.")
+        print(f"Output file '{output_filename}' generated with {self.num_rows} rows and {len(output_headers)} columns.")
         return output_filename
 
     def _generate_value(self, field_type: str) -> str:
@@ -157,68 +158,12 @@ class SecurityMasterGeneratorFromSOI:
     
     def run_rule_engine(self, inventory_filename: str, report_filename: str):
         """
-        Reads the generated inventory CSV file (which contains:
-            FIGI, CUSIP, SEDOL, ISIN, COMPANY_NAME, CURRENCY, ASSET_CLASS, ASSET_GROUP, APPLIED_DATE)
-        and checks the four security key fields (FIGI, CUSIP, SEDOL, ISIN) for errors.
-          - If a field is empty, records a warning.
-          - If a field does not match the expected regex pattern, records an error.
-        Also computes a unique composite key for each row by concatenating:
-          FIGI, CUSIP, SEDOL, ISIN, COMPANY_NAME, CURRENCY, ASSET_CLASS, ASSET_GROUP, and APPLIED_DATE.
-        Writes a report CSV file with columns:
-           RowNumber, UniqueKey, Field, FieldValue, Issue, Message
+        Checks the four security key fields (FIGI, CUSIP, SEDOL, ISIN) of every row of the
+        given CSV file and writes the issues to report_filename (see rule_engine.run_rule_engine):
+        an empty field is a Warning, one not matching its expected pattern an Error. The
+        identifiers come from SOIGenerator, so their check digits are verified with its scheme.
         """
-        # Expected regex patterns.
-        patterns = {
-            "FIGI": r"^BBG[A-Z0-9]{8}\d$",
-            "CUSIP": r"^[A-Z0-9*@#]{9}$",
-            "SEDOL": r"^[A-Z0-9]{7}$",
-            "ISIN": r"^[A-Z]{2}[A-Z0-9]{9}\d$"
-        }
-        issues = []
-        with open(inventory_filename, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row_index, row in enumerate(reader, start=1):
-                # Compute unique key: concatenate the 9 fields (4 from soi, 4 additional, and APPLIED_DATE)
-                unique_key = (
-                    row.get("FIGI", "") + "|" +
-                    row.get("CUSIP", "") + "|" +
-                    row.get("SEDOL", "") + "|" +
-                    row.get("ISIN", "") + "|" +
-                    row.get("COMPANY_NAME", "") + "|" +
-                    row.get("CURRENCY", "") + "|" +
-                    row.get("ASSET_CLASS", "") + "|" +
-                    row.get("ASSET_GROUP", "") + "|" +
-                    row.get("APPLIED_DATE", "")
-                )
-                # Validate the 4 key fields.
-                for field, pattern in patterns.items():
-                    value = row.get(field, "")
-                    if value == "":
-                        issues.append({
-                            "RowNumber": row_index,
-                            "UniqueKey": unique_key,
-                            "Field": field,
-                            "FieldValue": value,
-                            "Issue": "Warning",
-                            "Message": "Field is empty."
-                        })
-                    else:
-                        if not re.match(pattern, value):
-                            issues.append({
-                                "RowNumber": row_index,
-                                "UniqueKey": unique_key,
-                                "Field": field,
-                                "FieldValue": value,
-                                "Issue": "Error",
-                                "Message": f"Value does not match expected pattern for {field}."
-                            })
-        with open(report_filename, "w", newline="", encoding="utf-8") as csvfile:
-            fieldnames = ["RowNumber", "UniqueKey", "Field", "FieldValue", "Issue", "Message"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for issue in issues:
-                writer.writerow(issue)
-        print(f"Rule engine report generated: {report_filename}")
+        run_rule_engine(inventory_filename, report_filename, RuleEngine(check_digits=SOI_FAILURES))
 
 if __name__ == "__main__":
     soi_filename = "soi.csv"
@@ -1,9 +1,10 @@
-import csv
 import random
 import string
 import datetime
 import os
-import re
+from csv_pipeline import CsvRowOverlay
+from check_digits import SOI_FAILURES
+from rule_engine import RuleEngine, run_rule_engine, run_rule_engine_parallel
 
 def add_business_day(date_obj):
     """Adds one business day to date_obj (skipping weekends)."""
@@ -31,10 +32,9 @@ class SecurityMasterDailyUpdaterVendor:
         """Reads the CSV file (with underscore-prefixed headers for fixed and dummy fields, but APPLIED_DATE is plain)
            and stores its rows.
         """
-        with open(self.input_filename, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            self.fieldnames = reader.fieldnames  # e.g. ["FIGI", "CUSIP", "SEDOL", "ISIN", "COMPANY_NAME", "CURRENCY", "ASSET_CLASS", "ASSET_GROUP", "APPLIED_DATE", ...]
-            self.data = list(reader)
+        # Rows stay on disk; only the rows modified by the simulation are held in memory.
+        self.data = CsvRowOverlay(self.input_filename)
+        self.fieldnames = self.data.fieldnames  # e.g. ["FIGI", "CUSIP", "SEDOL", "ISIN", "COMPANY_NAME", "CURRENCY", "ASSET_CLASS", "ASSET_GROUP", "APPLIED_DATE", ...]
         if not self.vendor_name:
             self.extract_vendor_name()
         # Determine starting simulated date from the "APPLIED_DATE" field.
@@ -93,15 +93,17 @@ class SecurityMasterDailyUpdaterVendor:
         # Assume modifiable fields are those after the first 8 columns and before the final APPLIED_DATE.
         modifiable_fields = self.fieldnames[8:-1]
         selected_indices = random.sample(range(total_rows), num_rows_to_modify)
+        rows = self.data.fetch(selected_indices)
 
         for idx in selected_indices:
+            row = rows[idx]
             row_modified = False
             if num_fields_to_change > len(modifiable_fields):
                 fields_to_change = modifiable_fields
             else:
                 fields_to_change = random.sample(modifiable_fields, num_fields_to_change)
             for field in fields_to_change:
-                original_value = self.data[idx][field]
+                original_value = row[field]
                 if original_value.strip() == "":
                     continue
                 typ = self.detect_type(original_value)
@@ -109,17 +111,18 @@ class SecurityMasterDailyUpdaterVendor:
                     continue
                 new_value = self.generate_dummy_value_by_type(typ)
                 if new_value != original_value:
-                    self.data[idx][field] = new_value
+                    row[field] = new_value
                     row_modified = True
             if row_modified:
-                applied_str = self.data[idx].get("APPLIED_DATE", "").strip()
+                self.data[idx] = row
+                applied_str = row.get("APPLIED_DATE", "").strip()
                 if applied_str:
                     try:
                         current_date = datetime.datetime.strptime(applied_str, "%Y-%m-%d").date()
                     except Exception:
                         current_date = self.current_date
                     new_date = add_business_day(current_date)
-                    self.data[idx]["APPLIED_DATE"] = new_date.isoformat()
+                    row["APPLIED_DATE"] = new_date.isoformat()
 
     def run_for_days(self, num_days, num_rows_to_modify, num_fields_to_change):
         """Simulates modifications over a specified number of days.
@@ -140,72 +143,17 @@ class SecurityMasterDailyUpdaterVendor:
         return generated_files
 
     def save_file(self, output_filename):
-        with open(output_filename, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames)
-            writer.writeheader()
-            for row in self.data:
-                writer.writerow(row)
+        self.data.save(output_filename)
         print(f"Saved file: {output_filename}")
 
     def run_rule_engine(self, inventory_filename, report_filename):
         """
-        Reads the given CSV file (expected to have columns:
-            FIGI, CUSIP, SEDOL, ISIN, COMPANY_NAME, CURRENCY, ASSET_CLASS, ASSET_GROUP, APPLIED_DATE, ...)
-        and validates the four key fields (FIGI, CUSIP, SEDOL, ISIN).
-        Also computes a unique composite key for each row by concatenating:
-            FIGI, CUSIP, SEDOL, ISIN, COMPANY_NAME, CURRENCY, ASSET_CLASS, ASSET_GROUP, and APPLIED_DATE.
-        Writes a report CSV file with columns:
-           RowNumber, UniqueKey, Field, FieldValue, Issue, Message
+        Checks the four security key fields (FIGI, CUSIP, SEDOL, ISIN) of every row of the
+        given CSV file and writes the issues to report_filename (see rule_engine.run_rule_engine):
+        an empty field is a Warning, one not matching its expected pattern an Error. The
+        identifiers come from SOIGenerator, so their check digits are verified with its scheme.
         """
-        patterns = {
-            "FIGI": r"^BBG[A-Z0-9]{8}\d$",
-            "CUSIP": r"^[A-Z0-9*@#]{9}$",
-            "SEDOL": r"^[A-Z0-9]{7}$",
-            "ISIN": r"^[A-Z]{2}[A-Z0-9]{9}\d$"
-        }
-        issues = []
-        with open(inventory_filename, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row_index, row in enumerate(reader, start=1):
-                unique_key = (
-                    row.get("FIGI", "") + "|" +
-                    row.get("CUSIP", "") + "|" +
-                    row.get("SEDOL", "") + "|" +
-                    row.get("ISIN", "") + "|" +
-                    row.get("COMPANY_NAME", "") + "|" +
-                    row.get("CURRENCY", "") + "|" +
-                    row.get("ASSET_CLASS", "") + "|" +
-                    row.get("ASSET_GROUP", "") + "|" +
-                    row.get("APPLIED_DATE", "")
-                )
-                for field, pattern in patterns.items():
-                    value = row.get(field, "")
-                    if value.strip() == "":
-                        issues.append({
-                            "RowNumber": row_index,
-                            "UniqueKey": unique_key,
-                            "Field": field,
-                            "FieldValue": value,
-                            "Issue": "Warning",
-                            "Message": "Field is empty."
-                        })
-                    else:
-                        if not re.match(pattern, value):
-                            issues.append({
-                                "RowNumber": row_index,
-                                "UniqueKey": unique_key,
-                                "Field": field,
-                                "FieldValue": value,
-                                "Issue": "Error",
-                                "Message": f"Value does not match expected pattern for {field}."
-                            })
-        with open(report_filename, "w", newline="", encoding="utf-8") as csvfile:
-            fieldnames = ["RowNumber", "UniqueKey", "Field", "FieldValue", "Issue", "Message"]
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for issue in issues:
-                writer.writerow(issue)
-        print(f"Rule engine report generated: {report_filename}")
+        run_rule_engine(inventory_filename, report_filename, RuleEngine(check_digits=SOI_FAILURES))
 
 if __name__ == "__main__":
     input_file = input("Enter input CSV filename: ")
@@ -225,7 +173,8 @@ if __name__ == "__main__":
     rule_trace_dir = "rule_trace"
     os.makedirs(rule_trace_dir, exist_ok=True)
     
-    # For each delta file, run the rule engine and write the report to rule_trace folder.
+    # Run the rule engine on every delta file in parallel, writing each report to the rule_trace folder.
+    jobs = []
     for delta_file in delta_files:
         base = os.path.basename(delta_file)
         parts = base.rsplit("_", 1)
@@ -234,4 +183,5 @@ if __name__ == "__main__":
         else:
             date_part = updater.current_date.isoformat()
         report_filename = os.path.join(rule_trace_dir, f"rule_trace_{date_part}.csv")
-        updater.run_rule_engine(delta_file, report_filename)
\ No newline at end of file
+        jobs.append((delta_file, report_filename))
+    run_rule_engine_parallel(jobs, check_digits="soi")
@@ -4,6 +4,7 @@ import string
 import datetime
 import os
 from faker import Faker
+from csv_pipeline import read_fieldnames, read_rows
 
 fake = Faker()
 
@@ -54,17 +55,14 @@ class SecurityMasterGeneratorFromSOI:
         self.num_dummy_fields = num_dummy_fields
         self.underscore_count = underscore_count
         self.soi_fixed_fields = []  # Expected fixed fields from soi.csv
-        self.rows = []              # Rows read from soi.csv
+        self.num_rows = 0           # Rows written by generate_output (soi.csv is streamed, not held in memory)
         # Dictionary mapping (asset_class, asset_group) to a set of dummy field base names to leave empty.
         self.empty_pattern = {}
 
     def read_soi_file(self):
-        """Reads the soi.csv file and stores its fixed fields and rows."""
-        with open(self.soi_filename, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            self.soi_fixed_fields = reader.fieldnames  # For example, 4 columns.
-            self.rows = list(reader)
-        print(f"Loaded {len(self.rows)} rows from {self.soi_filename} with fixed fields: {self.soi_fixed_fields}")
+        """Reads the fixed fields of soi.csv; its rows are streamed by generate_output."""
+        self.soi_fixed_fields = read_fieldnames(self.soi_filename)
+        print(f"Reading rows from {self.soi_filename} with fixed fields: {self.soi_fixed_fields}")
 
     def generate_output(self):
         """
@@ -102,7 +100,9 @@ class SecurityMasterGeneratorFromSOI:
         with open(output_filename, "w", newline="", encoding="utf-8") as csvfile:
             writer = csv.DictWriter(csvfile, fieldnames=output_headers)
             writer.writeheader()
-            for fixed_row in self.rows:
+            self.num_rows = 0
+            for fixed_row in read_rows(self.soi_filename):
+                self.num_rows += 1
                 new_row = {}
                 # 1. Copy fixed fields from soi.csv.
                 for field in fixed:
@@ -139,7 +139,7 @@ class SecurityMasterGeneratorFromSOI:
                 # 4. Set APPLIED_DATE.
                 new_row["APPLIED_DATE"] = current_date
                 writer.writerow(new_row)
-        print(f"Output file '{output_filename}' generated with {len(self.rows)} rows and {len(output_headers)} columns.")
+        print(f"Output file '{output_filename}' generated with {self.num_rows} rows and {len(output_headers)} columns.")
 
     def _generate_value(self, field_type: str) -> str:
         if field_type == "integer":
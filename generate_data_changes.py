@@ -1,7 +1,7 @@
-import csv
 import random
 import string
 import datetime
+from csv_pipeline import CsvRowOverlay
 
 def add_business_day(date_obj):
     next_day = date_obj + datetime.timedelta(days=1)
@@ -16,10 +16,9 @@ class SecurityMasterModifier:
         self.data = []
 
     def read_file(self):
-        with open(self.filename, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            self.fieldnames = reader.fieldnames  # These should be like _FIGI, _CUSIP, ..., _APPLIED_DATE
-            self.data = list(reader)
+        # Rows stay on disk; only the rows modified by the simulation are held in memory.
+        self.data = CsvRowOverlay(self.filename)
+        self.fieldnames = self.data.fieldnames  # These should be like _FIGI, _CUSIP, ..., _APPLIED_DATE
         print(f"Read {len(self.data)} rows with {len(self.fieldnames)} fields.")
 
     def detect_type(self, value):
@@ -74,8 +73,10 @@ class SecurityMasterModifier:
         # and the last field is _APPLIED_DATE.
         modifiable_fields = self.fieldnames[8:-1]  # dummy fields
         rows_indices = random.sample(range(total_rows), num_rows_to_modify)
+        rows = self.data.fetch(rows_indices)
 
         for idx in rows_indices:
+            row = rows[idx]
             row_modified = False
             if num_fields_to_change > len(modifiable_fields):
                 fields_to_change = modifiable_fields
@@ -83,7 +84,7 @@ class SecurityMasterModifier:
                 fields_to_change = random.sample(modifiable_fields, num_fields_to_change)
 
             for field in fields_to_change:
-                original_value = self.data[idx][field]
+                original_value = row[field]
                 if original_value.strip() == "":
                     continue
                 typ = self.detect_type(original_value)
@@ -91,27 +92,24 @@ class SecurityMasterModifier:
                     continue
                 new_value = self.generate_dummy_value_by_type(typ)
                 if new_value != original_value:
-                    self.data[idx][field] = new_value
+                    row[field] = new_value
                     row_modified = True
 
             if row_modified:
-                applied_date_str = self.data[idx].get("APPLIED_DATE", "").strip()
+                self.data[idx] = row
+                applied_date_str = row.get("APPLIED_DATE", "").strip()
                 if applied_date_str:
                     try:
                         current_date = datetime.datetime.strptime(applied_date_str, "%Y-%m-%d").date()
                         new_date = add_business_day(current_date)
-                        self.data[idx]["APPLIED_DATE"] = new_date.isoformat()
+                        row["APPLIED_DATE"] = new_date.isoformat()
                     except Exception as e:
                         print(f"Error updating APPLIED_DATE for row {idx}: {e}")
 
         print(f"Modified {num_rows_to_modify} rows (fields that were originally empty remain unchanged).")
 
     def save_file(self, output_filename):
-        with open(output_filename, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames)
-            writer.writeheader()
-            for row in self.data:
-                writer.writerow(row)
+        self.data.save(output_filename)
         print(f"Modified data saved to {output_filename}.")
 
 if __name__ == "__main__":
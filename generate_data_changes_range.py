@@ -1,8 +1,8 @@
-import csv
 import random
 import string
 import datetime
 import os
+from csv_pipeline import CsvRowOverlay
 
 def add_business_day(date_obj):
     """Adds one business day to date_obj (skipping weekends)."""
@@ -30,10 +30,9 @@ class SecurityMasterDailyUpdaterVendor:
         """Reads the CSV file (with underscore-prefixed headers for fixed and dummy fields, but APPLIED_DATE is plain)
            and stores its rows.
         """
-        with open(self.input_filename, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            self.fieldnames = reader.fieldnames  # e.g. ["_FIGI", "_CUSIP", ... , "APPLIED_DATE"]
-            self.data = list(reader)
+        # Rows stay on disk; only the rows modified by the simulation are held in memory.
+        self.data = CsvRowOverlay(self.input_filename)
+        self.fieldnames = self.data.fieldnames  # e.g. ["_FIGI", "_CUSIP", ... , "APPLIED_DATE"]
         if not self.vendor_name:
             self.extract_vendor_name()
         # Determine starting simulated date from the "APPLIED_DATE" field.
@@ -93,15 +92,17 @@ class SecurityMasterDailyUpdaterVendor:
         # The last field is "APPLIED_DATE" (without underscores), and dummy fields are those between index 8 and the last.
         modifiable_fields = self.fieldnames[8:-1]
         selected_indices = random.sample(range(total_rows), num_rows_to_modify)
+        rows = self.data.fetch(selected_indices)
 
         for idx in selected_indices:
+            row = rows[idx]
             row_modified = False
             if num_fields_to_change > len(modifiable_fields):
                 fields_to_change = modifiable_fields
             else:
                 fields_to_change = random.sample(modifiable_fields, num_fields_to_change)
             for field in fields_to_change:
-                original_value = self.data[idx][field]
+                original_value = row[field]
                 if original_value.strip() == "":
                     continue
                 typ = self.detect_type(original_value)
@@ -109,18 +110,19 @@ class SecurityMasterDailyUpdaterVendor:
                     continue
                 new_value = self.generate_dummy_value_by_type(typ)
                 if new_value != original_value:
-                    self.data[idx][field] = new_value
+                    row[field] = new_value
                     row_modified = True
             if row_modified:
+                self.data[idx] = row
                 # Read the current business date from the "APPLIED_DATE" field (which is not underscored).
-                applied_str = self.data[idx].get("APPLIED_DATE", "").strip()
+                applied_str = row.get("APPLIED_DATE", "").strip()
                 if applied_str:
                     try:
                         current_date = datetime.datetime.strptime(applied_str, "%Y-%m-%d").date()
                     except Exception:
                         current_date = self.current_date
                     new_date = add_business_day(current_date)
-                    self.data[idx]["APPLIED_DATE"] = new_date.isoformat()
+                    row["APPLIED_DATE"] = new_date.isoformat()
 
     def run_for_days(self, num_days, num_rows_to_modify, num_fields_to_change):
         """Simulates modifications over a specified number of days.
@@ -138,11 +140,7 @@ class SecurityMasterDailyUpdaterVendor:
             self.save_file(output_filename)
 
     def save_file(self, output_filename):
-        with open(output_filename, "w", newline="", encoding="utf-8") as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=self.fieldnames)
-            writer.writeheader()
-            for row in self.data:
-                writer.writerow(row)
+        self.data.save(output_filename)
         print(f"Saved file: {output_filename}")
 
 if __name__ == "__main__":
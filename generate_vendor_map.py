@@ -1,6 +1,7 @@
 import csv
 import os
 import datetime
+from csv_pipeline import read_fieldnames, read_rows
 
 def extract_vendor_name(filename):
     """
@@ -44,13 +45,10 @@ def map_vendor_row(row, mapping):
 
 def read_vendor_file(filepath):
     """
-    Reads a CSV file and returns its headers and list of rows.
+    Returns the headers of a CSV file and a generator over its rows.
+    Rows are read lazily, so only one is held in memory at a time.
     """
-    with open(filepath, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        headers = reader.fieldnames
-        rows = list(reader)
-    return headers, rows
+    return read_fieldnames(filepath), read_rows(filepath)
 
 def write_model_file(output_filepath, model_fieldnames, mapped_rows):
     """
@@ -66,7 +64,7 @@ def write_model_file(output_filepath, model_fieldnames, mapped_rows):
 def process_file(input_filepath, output_dir):
     headers, rows = read_vendor_file(input_filepath)
     mapping = generate_vendor_mapping(headers)
-    mapped_rows = [map_vendor_row(row, mapping) for row in rows]
+    mapped_rows = (map_vendor_row(row, mapping) for row in rows)
     
     # Model fieldnames in the same order as the vendor file's headers.
     model_fieldnames = [mapping[h] for h in headers]
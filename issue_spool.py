@@ -0,0 +1,83 @@
+import json
+import os
+import re
+import struct
+import time
+import uuid
+
+# Offsets in the index file are unsigned 64-bit integers, one per issue.
+_OFFSET = struct.Struct("<Q")
+_SPOOL_ID = re.compile(r"^[0-9a-f]{32}$")
+
+class IssueSpool:
+    """
+    Rule engine issues of one upload, written to disk as they are found so the upload's
+    memory does not grow with its error count.
+
+    Issues are stored as JSON lines in <directory>/<spool_id>.jsonl, with the byte offset of
+    each line in <spool_id>.idx, so any page of them can be read back without scanning the
+    file (see read_issues). spool_id defaults to a new random id.
+    """
+    def __init__(self, directory, spool_id=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.spool_id = spool_id or uuid.uuid4().hex
+        self.count = 0
+        self._data = open(self._path(".jsonl"), "wb")
+        self._index = open(self._path(".idx"), "wb")
+
+    def _path(self, suffix):
+        return os.path.join(self.directory, self.spool_id + suffix)
+
+    def append(self, issues):
+        for issue in issues:
+            self._index.write(_OFFSET.pack(self._data.tell()))
+            self._data.write(json.dumps(issue, separators=(",", ":")).encode("utf-8") + b"\n")
+            self.count += 1
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+    def discard(self):
+        self.close()
+        for suffix in (".jsonl", ".idx"):
+            try:
+                os.remove(self._path(suffix))
+            except FileNotFoundError:
+                pass
+
+def read_issues(directory, spool_id, start, end):
+    """
+    Returns (issues start..end-1, total number of issues) of a spool, or None if there is no
+    spool with that id (e.g. it expired).
+    """
+    if not _SPOOL_ID.match(spool_id):
+        return None
+    base = os.path.join(directory, spool_id)
+    try:
+        index = open(base + ".idx", "rb")
+        data = open(base + ".jsonl", "rb")
+    except FileNotFoundError:
+        return None
+    with index, data:
+        total = os.fstat(index.fileno()).st_size // _OFFSET.size
+        start, end = max(start, 0), min(end, total)
+        if start >= end:
+            return [], total
+        index.seek(start * _OFFSET.size)
+        (offset,) = _OFFSET.unpack(index.read(_OFFSET.size))
+        data.seek(offset)
+        return [json.loads(data.readline()) for _ in range(end - start)], total
+
+def remove_expired(directory, max_age, suffixes=(".jsonl", ".idx")):
+    """Deletes the spools (files with the given suffixes) last written more than max_age seconds ago."""
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - max_age
+    for entry in os.scandir(directory):
+        if entry.name.endswith(suffixes) and entry.stat().st_mtime < cutoff:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,87 @@
+"""
+Manifest of the inventory files a load has written, kept in Postgres next to the data.
+
+One row per (target table, file) records the file's size, mtime and content hash and, for
+each sink, how many of its rows have been written and whether the file is complete. The
+Postgres sink updates its row count in the same transaction as the rows themselves, so after
+a crash a re-run can skip complete files and resume partial ones from the first row that
+was not written.
+"""
+
+import hashlib
+import os
+
+MANIFEST_TABLE = "load_manifest"
+SINKS = ("postgres", "redis")
+
+def create_manifest_table(cur):
+    columns_sql = ", ".join(f"{sink}_rows BIGINT NOT NULL DEFAULT 0, {sink}_status TEXT NOT NULL DEFAULT 'pending'"
+                            for sink in SINKS)
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MANIFEST_TABLE} (
+            target TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size BIGINT NOT NULL,
+            mtime DOUBLE PRECISION NOT NULL,
+            content_hash TEXT NOT NULL,
+            {columns_sql},
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            PRIMARY KEY (target, path)
+        );
+    """)
+
+def file_fingerprint(filepath, chunk_size=1 << 20):
+    """Returns the manifest identity of a file: absolute path, size, mtime and content hash."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    stat = os.stat(filepath)
+    return {"path": os.path.abspath(filepath), "size": stat.st_size, "mtime": stat.st_mtime,
+            "content_hash": digest.hexdigest()}
+
+def read_manifest(cur, target):
+    """Returns {path: entry} for every file recorded for `target`."""
+    cur.execute(f"SELECT * FROM {MANIFEST_TABLE} WHERE target = %s;", (target,))
+    names = [column.name for column in cur.description]
+    return {row[names.index("path")]: dict(zip(names, row)) for row in cur.fetchall()}
+
+def reset_manifest(cur, target):
+    """Forgets every file recorded for `target`, e.g. when its table is recreated."""
+    cur.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE target = %s;", (target,))
+
+def is_complete(entry):
+    return all(entry[f"{sink}_status"] == "complete" for sink in SINKS)
+
+def start_file(cur, target, fingerprint, resume=True):
+    """
+    Records that a load of the file is starting and returns, per sink, the number of rows it
+    already holds. With resume=False, or if the file's content changed, the counts restart at 0.
+    """
+    cur.execute(f"SELECT content_hash, {', '.join(f'{sink}_rows' for sink in SINKS)} FROM {MANIFEST_TABLE} "
+                f"WHERE target = %s AND path = %s;", (target, fingerprint["path"]))
+    row = cur.fetchone()
+    if resume and row is not None and row[0] == fingerprint["content_hash"]:
+        return dict(zip(SINKS, row[1:]))
+    reset_sql = ", ".join(f"{sink}_rows = 0, {sink}_status = 'pending'" for sink in SINKS)
+    cur.execute(f"""
+        INSERT INTO {MANIFEST_TABLE} (target, path, size, mtime, content_hash)
+        VALUES (%(target)s, %(path)s, %(size)s, %(mtime)s, %(content_hash)s)
+        ON CONFLICT (target, path) DO UPDATE
+        SET size = EXCLUDED.size, mtime = EXCLUDED.mtime, content_hash = EXCLUDED.content_hash,
+            {reset_sql}, updated_at = now();
+    """, dict(fingerprint, target=target))
+    return {sink: 0 for sink in SINKS}
+
+def record_progress(cur, target, path, sink, rows, status="partial"):
+    """Records that `sink` holds the first `rows` rows of the file."""
+    cur.execute(f"UPDATE {MANIFEST_TABLE} SET {sink}_rows = %s, {sink}_status = %s, updated_at = now() "
+                f"WHERE target = %s AND path = %s;", (rows, status, target, path))
+
+def promote_statements(target, staging_target):
+    """
+    Returns the statements moving the entries of a staging load over to the table it replaces;
+    run them in the transaction that swaps the tables.
+    """
+    return [f"DELETE FROM {MANIFEST_TABLE} WHERE target = '{target}';",
+            f"UPDATE {MANIFEST_TABLE} SET target = '{target}' WHERE target = '{staging_target}';"]
@@ -0,0 +1,156 @@
+"""
+Bulk ingest of inventory CSV files into Postgres, shared by the uploader scripts.
+
+The default path streams the file straight into COPY ... FROM STDIN. If COPY fails
+(e.g. a malformed row), the file is loaded again with batched INSERTs, which is slower
+but reports the error and keeps going for loaders that tolerate it.
+"""
+
+import csv
+import io
+import os
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extras
+from csv_pipeline import batched, write_batches
+
+# COPY options: csv.writer (and most CSV files) write empty strings unquoted, which COPY's
+# csv format would load as NULL; with NULL '\N' they are stored as '' like the INSERT path does.
+COPY_CSV = "FORMAT csv, NULL '\\N'"
+
+def read_header(filepath):
+    """Returns the header row of a CSV file."""
+    with open(filepath, newline="", encoding="utf-8") as csvfile:
+        return next(csv.reader(csvfile), [])
+
+def map_columns(header, column_map=None):
+    """
+    Returns the table columns for a file header. column_map renames file columns
+    (e.g. vendor headers to model columns); unmapped columns keep their name.
+    """
+    column_map = column_map or {}
+    return [column_map.get(col, col) for col in header]
+
+def copy_csv_file(conn, filepath, table_name, column_map=None):
+    """
+    Loads a CSV file with COPY FROM STDIN in a single statement and returns the row count.
+    Table columns missing from the file are left NULL.
+    """
+    columns = map_columns(read_header(filepath), column_map)
+    columns_sql = ", ".join([f'"{col}"' for col in columns])
+    copy_sql = f"COPY {table_name} ({columns_sql}) FROM STDIN WITH ({COPY_CSV}, HEADER true)"
+    with open(filepath, newline="", encoding="utf-8") as csvfile, conn.cursor() as cur:
+        cur.copy_expert(copy_sql, csvfile)
+        return cur.rowcount
+
+def insert_csv_file(conn, filepath, table_name, column_map=None, batch_size=100, rows_per_flush=10000):
+    """
+    Loads a CSV file with psycopg2.extras.execute_batch and returns the row count.
+    The file is streamed: rows_per_flush rows are parsed while the previous chunk is inserted,
+    so memory use does not depend on the file size.
+    """
+    with open(filepath, newline="", encoding="utf-8") as csvfile:
+        reader = csv.reader(csvfile)
+        columns = map_columns(next(reader, []), column_map)
+        def write_batch(rows):
+            insert_rows(conn, rows, table_name, columns, batch_size)
+        return write_batches(batched(reader, rows_per_flush), write_batch)
+
+def copy_rows(conn, rows, table_name, columns):
+    """Loads already parsed rows (lists of values in `columns` order) with one COPY FROM STDIN."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    columns_sql = ", ".join([f'"{col}"' for col in columns])
+    with conn.cursor() as cur:
+        cur.copy_expert(f"COPY {table_name} ({columns_sql}) FROM STDIN WITH ({COPY_CSV})", buffer)
+
+def insert_rows(conn, rows, table_name, columns, batch_size=100):
+    """Loads already parsed rows (lists of values in `columns` order) with execute_batch."""
+    columns_sql = ", ".join([f'"{col}"' for col in columns])
+    placeholders = ", ".join(["%s"] * len(columns))
+    insert_sql = f"INSERT INTO {table_name} ({columns_sql}) VALUES ({placeholders});"
+    with conn.cursor() as cur:
+        psycopg2.extras.execute_batch(cur, insert_sql, rows, page_size=batch_size)
+
+def write_rows(conn, rows, table_name, columns, batch_size=100, use_copy=True, progress=None):
+    """
+    Loads one batch of parsed rows in a transaction, with the same COPY-then-INSERT fallback
+    as ingest_csv_file. progress(cur), if given, runs in the same transaction (e.g. to record
+    how far the load got). `conn` must be in autocommit mode.
+    """
+    if use_copy:
+        try:
+            with transaction(conn) as cur:
+                copy_rows(conn, rows, table_name, columns)
+                if progress:
+                    progress(cur)
+            return
+        except psycopg2.Error as e:
+            print(f"COPY failed for a batch of {len(rows)} rows into {table_name}, falling back to batched inserts: {e}")
+    with transaction(conn) as cur:
+        insert_rows(conn, rows, table_name, columns, batch_size)
+        if progress:
+            progress(cur)
+
+def ingest_csv_file(conn, filepath, table_name, column_map=None, batch_size=100, use_copy=True):
+    """
+    Loads one CSV file into `table_name` and returns the row count. Uses COPY unless use_copy
+    is False, falling back to batched INSERTs if COPY fails. `conn` must be in autocommit mode,
+    so a failed COPY leaves no rows behind.
+    """
+    if use_copy:
+        try:
+            return copy_csv_file(conn, filepath, table_name, column_map)
+        except psycopg2.Error as e:
+            print(f"COPY failed for {os.path.basename(filepath)}, falling back to batched inserts: {e}")
+    return insert_csv_file(conn, filepath, table_name, column_map, batch_size)
+
+def replace_statements(table_name, staging, columns, key_columns):
+    """
+    Returns the statements replacing the rows of `table_name` that match a row of `staging`
+    on `key_columns` with the rows of `staging`. COPY stores empty values as '' (see COPY_CSV),
+    so a key is NULL only where its column is missing from the batch; those are set to '' first
+    so the rows can be matched with plain equality, which the key index serves, and are
+    stored as ''.
+    """
+    columns_sql = ", ".join([f'"{col}"' for col in columns + [col for col in key_columns if col not in columns]])
+    coalesce_sql = ", ".join([f'"{col}" = COALESCE("{col}", \'\')' for col in key_columns])
+    null_sql = " OR ".join([f'"{col}" IS NULL' for col in key_columns])
+    match_sql = " AND ".join([f't."{col}" = s."{col}"' for col in key_columns])
+    return [f"UPDATE {staging} SET {coalesce_sql} WHERE {null_sql};",
+            f"DELETE FROM {table_name} t USING {staging} s WHERE {match_sql};",
+            f"INSERT INTO {table_name} ({columns_sql}) SELECT {columns_sql} FROM {staging};"]
+
+def upsert_rows(conn, rows, table_name, columns, key_columns, progress=None):
+    """
+    Replaces the stored versions of a batch of parsed rows, matched on `key_columns`, in one
+    transaction: the batch is COPYed into a temporary table, the matching rows are deleted and
+    the batch is inserted (see replace_statements). progress(cur) runs in the same transaction,
+    as for write_rows. `conn` must be in autocommit mode.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    staging = f"{table_name}_delta"
+    columns_sql = ", ".join([f'"{col}"' for col in columns])
+    with transaction(conn) as cur:
+        cur.execute(f"CREATE TEMP TABLE {staging} (LIKE {table_name}) ON COMMIT DROP;")
+        cur.copy_expert(f"COPY {staging} ({columns_sql}) FROM STDIN WITH ({COPY_CSV})", buffer)
+        for statement in replace_statements(table_name, staging, columns, key_columns):
+            cur.execute(statement)
+        if progress:
+            progress(cur)
+
+@contextmanager
+def transaction(conn):
+    """Runs the block in an explicit transaction on an autocommit connection; yields a cursor."""
+    with conn.cursor() as cur:
+        cur.execute("BEGIN;")
+        try:
+            yield cur
+        except Exception:
+            cur.execute("ROLLBACK;")
+            raise
+        cur.execute("COMMIT;")
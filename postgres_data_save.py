@@ -1,6 +1,9 @@
 import csv
 import psycopg2
 from psycopg2.extras import execute_values
+from security_db import index_statements
+
+KEY_FIELDS = ["FIGI", "CUSIP", "SEDOL", "ISIN", "COMPANY_NAME", "CURRENCY", "ASSET_CLASS", "ASSET_GROUP"]
 
 class PostgresUploader:
     def __init__(self, dbname, user, password, host='localhost', port=5432, table_name='dummy_security_master'):
@@ -54,6 +57,19 @@ class PostgresUploader:
         tuples = [tuple(row) for row in rows]
         execute_values(cur, query, tuples)
 
+    def create_indexes(self):
+        """
+        Builds the lookup indexes used by app2.py. Call it after the bulk upload:
+        creating them once is much cheaper than maintaining them during the inserts.
+        """
+        statements = index_statements(self.table_name, key_fields=KEY_FIELDS, date_field="APPLIED_DATE",
+                                      identifier_fields=KEY_FIELDS[:4])
+        with self.connection.cursor() as cur:
+            for statement in statements:
+                cur.execute(statement)
+            self.connection.commit()
+        print(f"Indexes created on table '{self.table_name}'.")
+
     def close(self):
         """Closes the PostgreSQL connection."""
         self.connection.close()
@@ -75,4 +91,5 @@ if __name__ == "__main__":
     # Create table based on CSV header and then upload CSV data.
     uploader.create_table(csv_file)
     uploader.upload_csv(csv_file)
+    uploader.create_indexes()
     uploader.close()
\ No newline at end of file
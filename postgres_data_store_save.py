@@ -4,6 +4,9 @@ import os
 import csv
 import psycopg2
 from psycopg2.extras import execute_values
+from security_db import index_statements
+
+KEY_FIELDS = ["FIGI", "CUSIP", "SEDOL", "ISIN", "COMPANY_NAME", "CURRENCY", "ASSET_CLASS", "ASSET_GROUP"]
 
 class StoreToPostgresUploader:
     def __init__(self, folder='store', table_name='dummy_security_master'):
@@ -78,6 +81,19 @@ class StoreToPostgresUploader:
             print(f"Processing file: {filepath}")
             self.upload_file(filepath)
     
+    def create_indexes(self):
+        """
+        Builds the lookup indexes used by app2.py. Call it after the bulk upload:
+        creating them once is much cheaper than maintaining them during the inserts.
+        """
+        statements = index_statements(self.table_name, key_fields=KEY_FIELDS, date_field="APPLIED_DATE",
+                                      identifier_fields=KEY_FIELDS[:4])
+        with self.conn.cursor() as cur:
+            for statement in statements:
+                cur.execute(statement)
+            self.conn.commit()
+        print(f"Indexes created on table '{self.table_name}'.")
+
     def close(self):
         self.conn.close()
         print("Database connection closed.")
@@ -88,4 +104,5 @@ if __name__ == "__main__":
         table_name="dummy_security_master"
     )
     uploader.upload_all_files()
+    uploader.create_indexes()
     uploader.close()
\ No newline at end of file
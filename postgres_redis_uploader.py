@@ -1,20 +1,27 @@
+import argparse
 import csv
 import glob
+import itertools
 import os
 import datetime
-import random
 import psycopg2
-import psycopg2.extras
-import redis
+import threading
 import time
 from os import cpu_count
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from security_db import index_statements, swap_statements
+from load_manifest import (SINKS, create_manifest_table, file_fingerprint, read_manifest, reset_manifest, is_complete,
+                           start_file, record_progress, promote_statements)
+from csv_pipeline import batched, fan_out
+from pg_ingest import ingest_csv_file, map_columns, write_rows, upsert_rows
+from redis_store import (RecordWriter, get_client, store_records, bump_generation, promote_staging_db, make_record_key,
+                         row_hash, changed_rows, save_row_hashes, RECORD_ENCODINGS)
 
 # ---------- Redis Operations ----------
 
-def clear_redis_keys():
-    """Clears all keys in Redis."""
-    r = redis.Redis(host="localhost", port=6379, db=0)
+def clear_redis_keys(db=0):
+    """Clears all keys in a Redis db."""
+    r = get_client(db=db)
     r.flushdb()
     print("Redis keys cleared.")
 
@@ -39,43 +46,69 @@ def drop_and_create_postgres_table(model_columns, table_name="security_master"):
     cur.close()
     conn.close()
 
-def populate_postgres_table_for_file(filepath, table_name="security_master", batch_size=100):
+def create_postgres_table_if_missing(model_columns, table_name="security_master"):
+    """Creates the Postgres table (all columns TEXT) unless it already exists."""
+    conn = psycopg2.connect(dbname="postgres", user="jez", password="", host="localhost", port=5432)
+    conn.autocommit = True
+    cur = conn.cursor()
+    columns_sql = ", ".join([f'"{col}" TEXT' for col in model_columns])
+    cur.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({columns_sql});")
+    cur.close()
+    conn.close()
+
+def swap_postgres_tables(table_name="security_master", staging_table="security_master_staging"):
     """
-    Processes one CSV file from the inventory directory and inserts its rows into the Postgres table.
-    Uses psycopg2.extras.execute_batch to insert rows in batches.
+    Replaces the live table with the loaded and indexed staging table in one transaction,
+    carrying the staging load's manifest entries over to the live table.
     """
     conn = psycopg2.connect(dbname="postgres", user="jez", password="", host="localhost", port=5432)
+    try:
+        with conn, conn.cursor() as cur:
+            for statement in swap_statements(table_name, staging_table) + promote_statements(table_name, staging_table):
+                cur.execute(statement)
+    finally:
+        conn.close()
+    print(f"Postgres table '{staging_table}' swapped in as '{table_name}'.")
+
+def clear_manifest(table_name):
+    """Forgets the files recorded as loaded into `table_name`."""
+    conn = psycopg2.connect(dbname="postgres", user="jez", password="", host="localhost", port=5432)
     conn.autocommit = True
     cur = conn.cursor()
-    
-    with open(filepath, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        headers = reader.fieldnames
-        rows = list(reader)
-    
-    if not rows:
-        print(f"No rows found in {filepath}")
-        cur.close()
-        conn.close()
-        return 0
+    create_manifest_table(cur)
+    reset_manifest(cur, table_name)
+    cur.close()
+    conn.close()
 
-    columns = [f'"{col}"' for col in headers]
-    columns_sql = ', '.join(columns)
-    placeholders = ', '.join(['%s'] * len(headers))
-    insert_sql = f"INSERT INTO {table_name} ({columns_sql}) VALUES ({placeholders});"
-    
-    # Create a list of value tuples
-    values_list = [[row[col] for col in headers] for row in rows]
-    
-    # Use execute_batch for better performance
-    psycopg2.extras.execute_batch(cur, insert_sql, values_list, page_size=batch_size)
-    count = len(values_list)
+def populate_postgres_table_for_file(filepath, table_name="security_master", batch_size=100, use_copy=True):
+    """
+    Processes one CSV file from the inventory directory and loads its rows into the Postgres table.
+    Streams the file through COPY FROM STDIN; with use_copy=False (or if COPY fails) rows are
+    inserted with psycopg2.extras.execute_batch instead.
+    """
+    conn = psycopg2.connect(dbname="postgres", user="jez", password="", host="localhost", port=5432)
+    conn.autocommit = True
+    try:
+        count = ingest_csv_file(conn, filepath, table_name, batch_size=batch_size, use_copy=use_copy)
+    finally:
+        conn.close()
     
     print(f"Inserted {count} records from {os.path.basename(filepath)} into Postgres table '{table_name}'.")
-    
+    return count
+
+def create_postgres_indexes(table_name="security_master"):
+    """
+    Builds the lookup indexes on the Postgres table. Called once the bulk load is done,
+    since maintaining the indexes row by row during the load is much slower.
+    """
+    conn = psycopg2.connect(dbname="postgres", user="jez", password="", host="localhost", port=5432)
+    conn.autocommit = True
+    cur = conn.cursor()
+    for statement in index_statements(table_name):
+        cur.execute(statement)
+    print(f"Postgres indexes created on '{table_name}'.")
     cur.close()
     conn.close()
-    return count
 
 def populate_postgres_table(inventory_dir, table_name="security_master"):
     """
@@ -88,11 +121,19 @@ def populate_postgres_table(inventory_dir, table_name="security_master"):
         return
     
     total_inserted = 0
+    failed_files = []
     with ThreadPoolExecutor(max_workers=cpu_count()) as executor:
-        futures = [executor.submit(populate_postgres_table_for_file, filepath, table_name) for filepath in files]
+        futures = {executor.submit(populate_postgres_table_for_file, filepath, table_name): filepath for filepath in files}
         for future in as_completed(futures):
-            total_inserted += future.result()
+            try:
+                total_inserted += future.result()
+            except Exception as e:
+                print(f"Failed to load {os.path.basename(futures[future])} into Postgres: {e}")
+                failed_files.append(futures[future])
     print(f"Total inserted records into Postgres table '{table_name}': {total_inserted}")
+    if failed_files:
+        print(f"{len(failed_files)} file(s) failed to load: {sorted(failed_files)}")
+    return failed_files
 
 # ---------- CSV Loader to Redis ----------
 
@@ -102,24 +143,13 @@ def load_inventory_file_to_redis(filepath, key_fields):
     For each row, constructs a key using the first 8 columns (key_fields).
     Uses a Redis pipeline for better performance.
     """
-    r = redis.Redis(host="localhost", port=6379, db=0)
-    count = 0
+    r = get_client(db=0)
     with open(filepath, newline="", encoding="utf-8") as csvfile:
         reader = csv.DictReader(csvfile)
-        pipe = r.pipeline()
-        for row in reader:
-            key_values = [row.get(field, "").strip() for field in key_fields]
-            if False and any(v == "" for v in key_values):
-                key = f"record:{os.path.basename(filepath)}:{random.randint(100000,999999)}"
-            else:
-                key = "|".join(key_values)
-            # Store the entire row as a hash
-            pipe.hset(key, mapping=row)
-            count += 1
-            # Execute in batches of 100 commands
-            if count % 100 == 0:
-                pipe.execute()
-        pipe.execute()
+        # Store the entire row as a hash, register it for paging (counting it on the dashboard)
+        # and add it to the asset_class/asset_group/currency indexes, in adaptively sized pipelines
+        count = RecordWriter(r).write(("|".join(row.get(field, "").strip() for field in key_fields), row)
+                                      for row in reader)
     print(f"Loaded {count} records from {os.path.basename(filepath)} into Redis.")
     return count
 
@@ -127,7 +157,6 @@ def load_inventory_to_redis(inventory_dir):
     """
     Iterates over all CSV files in the inventory directory and loads each row into Redis concurrently.
     """
-    r = redis.Redis(host="localhost", port=6379, db=0)
     files = glob.glob(os.path.join(inventory_dir, "*.csv"))
     if not files:
         print(f"No CSV files found in directory '{inventory_dir}'.")
@@ -141,6 +170,186 @@ def load_inventory_to_redis(inventory_dir):
             total_loaded += future.result()
     print(f"Total loaded records into Redis: {total_loaded}")
 
+# ---------- Single-pass load into Postgres and Redis ----------
+
+def load_inventory_file(filepath, key_fields, table_name="security_master", rows_per_batch=5000, use_copy=True,
+                        incremental=False, redis_db=0, encoding="plain", resume_from=None):
+    """
+    Parses one CSV file once and writes each batch of rows to Postgres (COPY per batch) and
+    Redis (pipelined HSETs) concurrently. The reader stays at most a few batches ahead of the
+    slower of the two writers. Returns {"postgres": {...}, "redis": {...}} with the rows each
+    sink holds and its error, if any.
+
+    With incremental=True only rows whose hash differs from the one recorded by the previous
+    load are written, replacing their stored version in Postgres. The hashes of a batch's rows are
+    recorded as soon as both sinks have written the batch, so memory does not grow with the file.
+    `encoding` is the Redis record encoding (see redis_store.RECORD_ENCODINGS).
+
+    Each sink's progress is recorded in the load manifest (see load_manifest.start_file);
+    resume_from ({sink: rows}) skips the rows a previous, interrupted run already wrote.
+    """
+    resume_from = resume_from or {sink: 0 for sink in SINKS}
+    manifest_path = os.path.abspath(filepath)
+    conn = psycopg2.connect(dbname="postgres", user="jez", password="", host="localhost", port=5432)
+    conn.autocommit = True
+    # The Redis writer records its progress on its own connection, since the Postgres writer's
+    # connection is inside a transaction at the same time.
+    manifest_conn = psycopg2.connect(dbname="postgres", user="jez", password="", host="localhost", port=5432)
+    manifest_conn.autocommit = True
+    r = get_client(db=redis_db)
+    # An incremental load overwrites records that may have been stored in another encoding.
+    redis_writer = RecordWriter(r, encoding, replace=incremental)
+    start = min(resume_from.values())
+    rows_held = dict(resume_from)
+    try:
+        with open(filepath, newline="", encoding="utf-8") as csvfile:
+            reader = csv.reader(csvfile)
+            header = next(reader, [])
+            columns = map_columns(header)
+            # Rows every sink already holds are skipped without being hashed or sent anywhere.
+            for _ in itertools.islice(reader, start):
+                pass
+
+            # {first row of a batch: [its row hashes, sinks yet to write it]}
+            unsaved_hashes = {}
+            hashes_lock = threading.Lock()
+
+            def written(sink, first):
+                with hashes_lock:
+                    hashes, waiting = unsaved_hashes[first]
+                    waiting.discard(sink)
+                    if waiting:
+                        return
+                    del unsaved_hashes[first]
+                save_row_hashes(r, hashes)
+
+            def hashed_batches():
+                first = start
+                for batch in batched(reader, rows_per_batch):
+                    records = [dict(zip(header, row)) for row in batch]
+                    keys = [make_record_key(record, key_fields) for record in records]
+                    hashes = [row_hash(record) for record in records]
+                    if incremental:
+                        positions = set(changed_rows(r, keys, hashes))
+                    else:
+                        positions = range(len(batch))
+                    with hashes_lock:
+                        unsaved_hashes[first] = [{keys[i]: hashes[i] for i in positions}, set(SINKS)]
+                    first += len(batch)
+                    # Unchanged rows are sent as None so both writers can keep count of the file's rows.
+                    yield [row if i in positions else None for i, row in enumerate(batch)]
+
+            def resumable(sink, write):
+                offered = [start]
+                def write_batch(batch):
+                    first = offered[0]
+                    offered[0] += len(batch)
+                    # The sink may be ahead of the other one; skip what it already holds.
+                    rows = [row for row in batch[max(rows_held[sink] - first, 0):] if row is not None]
+                    if offered[0] > rows_held[sink]:
+                        write(rows, offered[0])
+                        rows_held[sink] = offered[0]
+                    written(sink, first)
+                return write_batch
+
+            def write_postgres(rows, rows_done):
+                # The row count is committed together with the rows.
+                progress = lambda cur: record_progress(cur, table_name, manifest_path, "postgres", rows_done)
+                if not rows:
+                    with conn.cursor() as cur:
+                        progress(cur)
+                elif incremental:
+                    upsert_rows(conn, rows, table_name, columns, key_fields + ["applied_date"], progress=progress)
+                else:
+                    write_rows(conn, rows, table_name, columns, use_copy=use_copy, progress=progress)
+
+            def write_redis(rows, rows_done):
+                # Redis writes are idempotent, so recording progress after them is enough.
+                store_records(r, (dict(zip(header, row)) for row in rows), key_fields, writer=redis_writer)
+                with manifest_conn.cursor() as cur:
+                    record_progress(cur, table_name, manifest_path, "redis", rows_done)
+
+            sinks = {"postgres": resumable("postgres", write_postgres), "redis": resumable("redis", write_redis)}
+            results = fan_out(hashed_batches(), sinks)
+        with manifest_conn.cursor() as cur:
+            for sink, result in results.items():
+                result["rows"] = rows_held[sink]
+                status = "complete" if result["error"] is None else "failed"
+                record_progress(cur, table_name, manifest_path, sink, rows_held[sink], status)
+    finally:
+        conn.close()
+        manifest_conn.close()
+    print(f"Loaded {os.path.basename(filepath)}: "
+          + ", ".join(f"{sink} {result['rows']} rows" for sink, result in results.items()))
+    return results
+
+def load_inventory(inventory_dir, table_name="security_master", incremental=False, redis_db=0, encoding="plain",
+                   resume=True):
+    """
+    Loads every CSV file in the inventory directory into Postgres and Redis in a single pass
+    per file, one file per worker thread. Returns {sink: [files that failed to load]}.
+
+    An incremental load goes through the files one at a time in name (i.e. date) order, so a
+    security present in several daily files is compared against the previous day's row.
+
+    Files the load manifest records as complete for `table_name`, with unchanged content, are
+    skipped, and partially loaded ones resume where they stopped (resume=False reloads them).
+    """
+    files = sorted(glob.glob(os.path.join(inventory_dir, "*.csv")))
+    if not files:
+        print(f"No CSV files found in directory '{inventory_dir}'.")
+        return {}
+
+    conn = psycopg2.connect(dbname="postgres", user="jez", password="", host="localhost", port=5432)
+    conn.autocommit = True
+    pending = []
+    changed_files = []
+    with conn.cursor() as cur:
+        create_manifest_table(cur)
+        manifest = read_manifest(cur, table_name)
+        for filepath in files:
+            fingerprint = file_fingerprint(filepath)
+            entry = manifest.get(fingerprint["path"])
+            if resume and entry and entry["content_hash"] == fingerprint["content_hash"] and is_complete(entry):
+                print(f"Skipping {os.path.basename(filepath)}: already loaded.")
+                continue
+            if resume and entry and entry["content_hash"] != fingerprint["content_hash"] and not incremental:
+                # The rows of the earlier version cannot be told apart from the new ones in the table.
+                print(f"{os.path.basename(filepath)} changed since it was loaded into '{table_name}'; "
+                      f"run a full reload.")
+                changed_files.append(filepath)
+                continue
+            pending.append((filepath, start_file(cur, table_name, fingerprint, resume=resume)))
+    conn.close()
+
+    key_fields = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
+    totals = {"postgres": 0, "redis": 0}
+    failed_files = {"postgres": list(changed_files), "redis": list(changed_files)}
+    with ThreadPoolExecutor(max_workers=1 if incremental else cpu_count()) as executor:
+        futures = {executor.submit(load_inventory_file, filepath, key_fields, table_name,
+                                   incremental=incremental, redis_db=redis_db, encoding=encoding,
+                                   resume_from=resume_from): filepath
+                   for filepath, resume_from in pending}
+        for future in as_completed(futures):
+            filepath = futures[future]
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"Failed to read {os.path.basename(filepath)}: {e}")
+                for sink in failed_files:
+                    failed_files[sink].append(filepath)
+                continue
+            for sink, result in results.items():
+                totals[sink] += result["rows"]
+                if result["error"] is not None:
+                    print(f"Failed to load {os.path.basename(filepath)} into {sink}: {result['error']}")
+                    failed_files[sink].append(filepath)
+    print(f"Total loaded records: Postgres table '{table_name}' {totals['postgres']}, Redis {totals['redis']}")
+    for sink, files_failed in failed_files.items():
+        if files_failed:
+            print(f"{len(files_failed)} file(s) failed to load into {sink}: {sorted(files_failed)}")
+    return failed_files
+
 # def load_inventory_to_redis(inventory_dir):
 #     """
 #     Iterates over all CSV files in the inventory directory and loads each row into Redis as a hash.
@@ -174,11 +383,23 @@ def load_inventory_to_redis(inventory_dir):
 
 # ---------- Main Function ----------
 
-def main():
+# A full reload is built in these and swapped in once complete, so the app keeps serving
+# the previous data set until then.
+STAGING_TABLE = "security_master_staging"
+STAGING_REDIS_DB = 1
+
+def main(incremental=False, encoding="plain", resume=False):
     inventory_dir = "inventory"  # Directory containing model CSV files.
+    if incremental:
+        # Upserts go straight to the live table and db; each batch is applied atomically.
+        table_name, redis_db = "security_master", 0
+    else:
+        table_name, redis_db = STAGING_TABLE, STAGING_REDIS_DB
     
-    # Step 1: Clear Redis keys.
-    clear_redis_keys()
+    # Step 1: Clear the staging Redis db (a full reload only; an incremental load compares against
+    # the live one, and a resumed reload keeps what the interrupted run loaded).
+    if not incremental and not resume:
+        clear_redis_keys(db=redis_db)
     
     # Step 2: Process the first CSV in the inventory directory to obtain model columns.
     files = glob.glob(os.path.join(inventory_dir, "*.csv"))
@@ -190,14 +411,47 @@ def main():
         model_columns = reader.fieldnames
     print("Model columns detected:", model_columns)
     
-    # Step 3: Drop and create the Postgres table.
-    drop_and_create_postgres_table(model_columns, table_name="security_master")
+    # Step 3: Drop and create the staging table, forgetting its manifest entries. An incremental load
+    # keeps the live table and its indexes, which the per-batch upserts use to find the versions
+    # they replace; a resumed reload keeps the staging table.
+    if incremental:
+        create_postgres_table_if_missing(model_columns, table_name=table_name)
+        create_postgres_indexes(table_name=table_name)
+    elif resume:
+        create_postgres_table_if_missing(model_columns, table_name=table_name)
+    else:
+        drop_and_create_postgres_table(model_columns, table_name=table_name)
+        clear_manifest(table_name)
+    
+    # Step 4: Parse each inventory file once and load it into Postgres and Redis concurrently.
+    failed_files = load_inventory(inventory_dir, table_name=table_name, incremental=incremental, redis_db=redis_db,
+                                  encoding=encoding)
+    
+    if incremental:
+        # Step 5: Publish a new load generation so the app drops its cached responses.
+        bump_generation(get_client(db=0))
+        return
+    
+    if any(failed_files.values()):
+        print("Some files failed to load; keeping the current data live. Staging data left in place for inspection.")
+        return
     
-    # Step 4: Populate the Postgres table with data from all CSV files in inventory concurrently.
-    populate_postgres_table(inventory_dir, table_name="security_master")
+    # Step 5: Build the lookup indexes on the staging table now that the bulk load is done.
+    create_postgres_indexes(table_name=table_name)
     
-    # Step 5: Load inventory files into Redis concurrently.
-    load_inventory_to_redis(inventory_dir)
+    # Step 6: Swap the staging table and Redis db in. The Redis swap carries a new load
+    # generation, so the app drops its cached responses.
+    swap_postgres_tables("security_master", table_name)
+    promote_staging_db(get_client(db=redis_db), redis_db, live_db=0)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Load the inventory CSV files into Postgres and Redis.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only load rows that are new or changed since the previous load")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue an interrupted full reload, skipping the files it completed")
+    parser.add_argument("--encoding", choices=RECORD_ENCODINGS, default="plain",
+                        help="Redis record encoding: plain, sparse (omit empty fields) or packed "
+                             "(sparse, with the dummy columns in one compressed field)")
+    args = parser.parse_args()
+    main(incremental=args.incremental, encoding=args.encoding, resume=args.resume)
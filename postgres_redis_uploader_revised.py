@@ -4,14 +4,16 @@ import os
 import datetime
 import random
 import psycopg2
-import redis
 import time
 from os import cpu_count
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from security_db import index_statements, swap_statements
+from pg_ingest import ingest_csv_file
+from redis_store import RecordWriter, get_client, promote_staging_db
 
-def clear_redis_keys():
-    """Clears all keys in Redis (and the security_keys index)."""
-    r = redis.Redis(host="localhost", port=6379, db=0)
+def clear_redis_keys(db=0):
+    """Clears all keys in a Redis db."""
+    r = get_client(db=db)
     r.flushdb()
     print("Redis keys cleared.")
 
@@ -34,43 +36,48 @@ def drop_and_create_postgres_table(model_columns, table_name="security_master"):
     cur.close()
     conn.close()
 
-def populate_postgres_table_for_file(filepath, table_name="security_master", batch_size=100):
+def populate_postgres_table_for_file(filepath, table_name="security_master", batch_size=100, use_copy=True):
     """
-    Processes one CSV file from the inventory directory and inserts its rows into the Postgres table.
-    Uses psycopg2.extras.execute_batch to insert rows in batches.
+    Processes one CSV file from the inventory directory and loads its rows into the Postgres table.
+    Streams the file through COPY FROM STDIN; with use_copy=False (or if COPY fails) rows are
+    inserted with psycopg2.extras.execute_batch instead.
     """
     conn = psycopg2.connect(dbname="postgres", user="postgres", password="postgres", host="localhost", port=5432)
     conn.autocommit = True
-    cur = conn.cursor()
-    
-    with open(filepath, newline="", encoding="utf-8") as csvfile:
-        reader = csv.DictReader(csvfile)
-        headers = reader.fieldnames
-        rows = list(reader)
-    
-    if not rows:
-        print(f"No rows found in {filepath}")
-        cur.close()
+    try:
+        count = ingest_csv_file(conn, filepath, table_name, batch_size=batch_size, use_copy=use_copy)
+    finally:
         conn.close()
-        return 0
-
-    columns = [f'"{col}"' for col in headers]
-    columns_sql = ', '.join(columns)
-    placeholders = ', '.join(['%s'] * len(headers))
-    insert_sql = f"INSERT INTO {table_name} ({columns_sql}) VALUES ({placeholders});"
-    
-    # Create a list of value tuples
-    values_list = [[row[col] for col in headers] for row in rows]
-    
-    # Use execute_batch for better performance
-    psycopg2.extras.execute_batch(cur, insert_sql, values_list, page_size=batch_size)
-    count = len(values_list)
     
     print(f"Inserted {count} records from {os.path.basename(filepath)} into Postgres table '{table_name}'.")
-    
+    return count
+
+def create_postgres_indexes(table_name="security_master"):
+    """
+    Builds the lookup indexes on the Postgres table. Called once the bulk load is done,
+    since maintaining the indexes row by row during the load is much slower.
+    """
+    conn = psycopg2.connect(dbname="postgres", user="postgres", password="postgres", host="localhost", port=5432)
+    conn.autocommit = True
+    cur = conn.cursor()
+    for statement in index_statements(table_name):
+        cur.execute(statement)
+    print(f"Postgres indexes created on '{table_name}'.")
     cur.close()
     conn.close()
-    return count
+
+def swap_postgres_tables(table_name="security_master", staging_table="security_master_staging"):
+    """
+    Replaces the live table with the loaded and indexed staging table in one transaction.
+    """
+    conn = psycopg2.connect(dbname="postgres", user="postgres", password="postgres", host="localhost", port=5432)
+    try:
+        with conn, conn.cursor() as cur:
+            for statement in swap_statements(table_name, staging_table):
+                cur.execute(statement)
+    finally:
+        conn.close()
+    print(f"Postgres table '{staging_table}' swapped in as '{table_name}'.")
 
 def populate_postgres_table(inventory_dir, table_name="security_master"):
     """
@@ -83,19 +90,46 @@ def populate_postgres_table(inventory_dir, table_name="security_master"):
         return
     
     total_inserted = 0
+    failed_files = []
     with ThreadPoolExecutor(max_workers=cpu_count()) as executor:
-        futures = [executor.submit(populate_postgres_table_for_file, filepath, table_name) for filepath in files]
+        futures = {executor.submit(populate_postgres_table_for_file, filepath, table_name): filepath for filepath in files}
         for future in as_completed(futures):
-            total_inserted += future.result()
+            try:
+                total_inserted += future.result()
+            except Exception as e:
+                print(f"Failed to load {os.path.basename(futures[future])} into Postgres: {e}")
+                failed_files.append(futures[future])
     print(f"Total inserted records into Postgres table '{table_name}': {total_inserted}")
+    if failed_files:
+        print(f"{len(failed_files)} file(s) failed to load: {sorted(failed_files)}")
+    return failed_files
+
+def load_inventory_file_to_redis(filepath, key_fields, redis_db=0):
+    """
+    Loads one CSV file into Redis, writing each row as a hash (see redis_store.RecordWriter)
+    through pipelines on the shared connection pool. Returns the number of rows loaded.
+    """
+    def keyed_rows(reader):
+        for row in reader:
+            key_values = [row.get(field, "").strip() for field in key_fields]
+            if any(v == "" for v in key_values):
+                key = f"record:{os.path.basename(filepath)}:{random.randint(100000,999999)}"
+            else:
+                key = "|".join(key_values)
+            yield key, row
+
+    with open(filepath, newline="", encoding="utf-8") as csvfile:
+        count = RecordWriter(get_client(db=redis_db)).write(keyed_rows(csv.DictReader(csvfile)))
+    print(f"Loaded {count} records from {os.path.basename(filepath)} into Redis.")
+    return count
 
-def load_inventory_to_redis(inventory_dir):
+def load_inventory_to_redis(inventory_dir, redis_db=0):
     """
-    Iterates over all CSV files in the inventory directory and loads each row into Redis as a hash.
+    Iterates over all CSV files in the inventory directory and loads each row into Redis as a hash,
+    one file per worker thread.
     Constructs the Redis key by concatenating the values of the first 8 model columns.
-    Also, for each record, adds the key to the sorted set 'security_keys' (using current time as score) for efficient pagination.
+    Also, for each record, adds the key to the sorted set 'security_keys' (see redis_store.register_record) for efficient pagination.
     """
-    r = redis.Redis(host="localhost", port=6379, db=0)
     files = glob.glob(os.path.join(inventory_dir, "*.csv"))
     if not files:
         print(f"No CSV files found in directory '{inventory_dir}'.")
@@ -104,25 +138,21 @@ def load_inventory_to_redis(inventory_dir):
     count = 0
     # Define the fixed field names (first 8 model columns)
     key_fields = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
-    for filepath in files:
-        with open(filepath, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                key_values = [row.get(field, "").strip() for field in key_fields]
-                if any(v == "" for v in key_values):
-                    key = f"record:{os.path.basename(filepath)}:{random.randint(100000,999999)}"
-                else:
-                    key = "|".join(key_values)
-                r.hset(key, mapping=row)
-                # Add the key to a sorted set with current time as score for pagination.
-                r.zadd("security_keys", {key: time.time()})
-                count += 1
+    with ThreadPoolExecutor(max_workers=cpu_count()) as executor:
+        futures = [executor.submit(load_inventory_file_to_redis, filepath, key_fields, redis_db) for filepath in files]
+        for future in as_completed(futures):
+            count += future.result()
     print(f"Loaded {count} records into Redis.")
 
+# A full reload is built in these and swapped in once complete, so the app keeps serving
+# the previous data set until then.
+STAGING_TABLE = "security_master_staging"
+STAGING_REDIS_DB = 1
+
 def main():
     inventory_dir = "inventory"  # Directory containing CSV files.
     
-    clear_redis_keys()
+    clear_redis_keys(db=STAGING_REDIS_DB)
     
     files = glob.glob(os.path.join(inventory_dir, "*.csv"))
     if not files:
@@ -133,9 +163,14 @@ def main():
         model_columns = reader.fieldnames
     print("Model columns detected:", model_columns)
     
-    drop_and_create_postgres_table(model_columns, table_name="security_master")
-    populate_postgres_table(inventory_dir, table_name="security_master")
-    load_inventory_to_redis(inventory_dir)
+    drop_and_create_postgres_table(model_columns, table_name=STAGING_TABLE)
+    if populate_postgres_table(inventory_dir, table_name=STAGING_TABLE):
+        print("Some files failed to load; keeping the current data live. Staging data left in place for inspection.")
+        return
+    create_postgres_indexes(table_name=STAGING_TABLE)
+    load_inventory_to_redis(inventory_dir, redis_db=STAGING_REDIS_DB)
+    swap_postgres_tables("security_master", STAGING_TABLE)
+    promote_staging_db(get_client(db=STAGING_REDIS_DB), STAGING_REDIS_DB, live_db=0)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
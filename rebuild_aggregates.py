@@ -0,0 +1,9 @@
+import redis
+from redis_store import rebuild_aggregates, bump_generation
+
+# Recomputes the dashboard asset_class / asset_group counts from the records stored in Redis.
+# Only needed if the counters drift, e.g. after keys were written or deleted outside the loaders.
+r = redis.Redis(host='localhost', port=6379, db=0)
+total = rebuild_aggregates(r)
+bump_generation(r)  # so the app stops serving cached dashboard counts
+print("Dashboard aggregates rebuilt from", total, "records.")
@@ -1,5 +1,6 @@
 import redis
 from redis.commands.search.query import Query
+from redis_store import company_index_key, decode_record
 
 class RedisSecurityCacheIndexer:
     def __init__(self, host='localhost', port=6379, db=0):
@@ -20,12 +21,15 @@ class RedisSecurityCacheIndexer:
             if value:
                 index_key = f"index:{field}:{value}"
                 self.r.sadd(index_key, key)
+        # Case-insensitive company index, as used by the /company_data route
+        company_name = record.get("COMPANY_NAME", "")
+        if company_name.strip():
+            self.r.sadd(company_index_key(company_name), key)
         print(f"Record stored with key: {key}")
 
     def get_record_by_key(self, key):
         """Retrieve a record directly using its composite key."""
-        rec = self.r.hgetall(key)
-        return {k.decode('utf-8'): v.decode('utf-8') for k, v in rec.items()}
+        return decode_record(self.r.hgetall(key))
 
     def search_by_field(self, field, value):
         """
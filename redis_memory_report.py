@@ -0,0 +1,84 @@
+import argparse
+import json
+import random
+import redis
+from redis_store import RECORD_ENCODINGS, REGISTRY_KEY, decode_record, encode_record, iter_record_keys
+
+# Estimates how much memory the security records take in Redis under each record encoding.
+# A sample of stored records is re-written under scratch keys in every encoding and measured
+# with MEMORY USAGE; the per-record averages are scaled to the number of registered records.
+# Prints one JSON line per encoding.
+#
+#   python redis_memory_report.py --sample 1000
+
+SCRATCH_PREFIX = "meta:memory_report:"
+
+def sample_keys(r, sample_size):
+    """Returns up to sample_size record keys, chosen at random from the registry if it is populated."""
+    total = r.zcard(REGISTRY_KEY)
+    if total:
+        positions = random.sample(range(total), min(sample_size, total))
+        pipe = r.pipeline(transaction=False)
+        for position in positions:
+            pipe.zrange(REGISTRY_KEY, position, position)
+        return [keys[0] for keys in pipe.execute() if keys]
+    keys = []
+    for key in iter_record_keys(r):
+        keys.append(key)
+        if len(keys) >= sample_size:
+            break
+    return keys
+
+def measure(r, rows, encoding):
+    """Writes `rows` under scratch keys in `encoding` and returns their MEMORY USAGE in bytes."""
+    pipe = r.pipeline(transaction=False)
+    for i, row in enumerate(rows):
+        pipe.hset(f"{SCRATCH_PREFIX}{i}", mapping=encode_record(row, encoding))
+    pipe.execute()
+    for i in range(len(rows)):
+        pipe.memory_usage(f"{SCRATCH_PREFIX}{i}", samples=0)
+    usages = pipe.execute()
+    pipe.delete(*[f"{SCRATCH_PREFIX}{i}" for i in range(len(rows))])
+    pipe.execute()
+    return sum(usage or 0 for usage in usages)
+
+def main():
+    parser = argparse.ArgumentParser(description="Redis memory per record encoding, from a sample of stored records.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6379)
+    parser.add_argument("--db", type=int, default=0)
+    parser.add_argument("--sample", type=int, default=1000, help="number of records to sample")
+    args = parser.parse_args()
+
+    r = redis.Redis(host=args.host, port=args.port, db=args.db)
+    keys = sample_keys(r, args.sample)
+    if not keys:
+        print("No records found.")
+        return
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.hgetall(key)
+    records = [decode_record(fields) for fields in pipe.execute()]
+    # The sparse encodings drop empty columns, so rebuild full rows before re-encoding them.
+    columns = sorted({column for record in records for column in record})
+    rows = [{column: record.get(column, "") for column in columns} for record in records]
+
+    pipe = r.pipeline(transaction=False)
+    for key in keys:
+        pipe.memory_usage(key, samples=0)
+    stored_bytes = sum(usage or 0 for usage in pipe.execute())
+    total = r.zcard(REGISTRY_KEY)
+    print(json.dumps({"encoding": "stored", "records_sampled": len(rows), "columns": len(columns),
+                      "bytes_per_record": round(stored_bytes / len(rows)),
+                      "estimated_total_mb": round(stored_bytes / len(rows) * total / 2**20, 1),
+                      "used_memory_mb": round(r.info("memory")["used_memory"] / 2**20, 1)}), flush=True)
+    plain_bytes = None
+    for encoding in RECORD_ENCODINGS:
+        encoded_bytes = measure(r, rows, encoding)
+        plain_bytes = plain_bytes or encoded_bytes
+        print(json.dumps({"encoding": encoding, "bytes_per_record": round(encoded_bytes / len(rows)),
+                          "estimated_total_mb": round(encoded_bytes / len(rows) * total / 2**20, 1),
+                          "saving_vs_plain": f"{1 - encoded_bytes / plain_bytes:.0%}"}), flush=True)
+
+if __name__ == "__main__":
+    main()
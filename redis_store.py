@@ -0,0 +1,468 @@
+"""
+Redis key layout shared by the loaders and the Flask app.
+
+Security records are stored as hashes keyed by the 8 key fields joined with "|".
+Everything else the loaders write into the same db (index sets, registries, ...)
+lives under a reserved prefix so that record scans can skip it.
+"""
+
+import hashlib
+import json
+import threading
+import time
+import zlib
+from collections import defaultdict
+
+import redis
+from redis.backoff import ExponentialBackoff
+from redis.commands.core import Script
+from redis.exceptions import ConnectionError, ResponseError, TimeoutError
+from redis.retry import Retry
+
+# The fixed model columns that make up a record key.
+KEY_FIELDS = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
+
+# Fields with a value -> key-set index maintained at load time.
+INDEXED_FIELDS = ["asset_class", "asset_group", "currency"]
+
+INDEX_PREFIX = "index:"
+
+# Sorted set of every record key. All members share score 0, so ZRANGE returns them in
+# lexicographic order and a page boundary can be resumed with ZRANGEBYLEX.
+REGISTRY_KEY = "security_keys"
+
+# Hash of per-category record counts for the dashboard, with fields "<field>:<value>".
+AGGREGATES_KEY = "agg:dashboard"
+AGGREGATED_FIELDS = ["asset_class", "asset_group"]
+
+# Token identifying the data set currently loaded; the loaders replace it when they finish.
+GENERATION_KEY = "meta:load_generation"
+
+# Hash of record key -> "<applied_date>:<row digest>" of the row last loaded under it, used by
+# incremental loads to skip rows that have not changed since.
+ROW_HASHES_KEY = "meta:row_hashes"
+
+# Record encodings accepted by store_records:
+#   plain  - every column is a hash field, empty ones included (the original layout)
+#   sparse - empty columns are omitted
+#   packed - sparse, and every column outside UNPACKED_FIELDS goes into a single zlib
+#            compressed JSON field, PACKED_FIELD. Wide records then stay under Redis'
+#            hash-max-listpack-entries and are stored in the compact listpack encoding.
+RECORD_ENCODINGS = ("plain", "sparse", "packed")
+PACKED_FIELD = "_packed"
+UNPACKED_FIELDS = KEY_FIELDS + ["applied_date"]
+
+# Rule engine issues: a list of JSON issues per security and, per applied date, the set of
+# securities with issues that day.
+RULE_TRACE_PREFIX = "rule_trace:"
+
+# Key prefixes that never hold security records. "rule_trace" also covers the single list
+# older loaders pushed every issue onto.
+RESERVED_PREFIXES = (INDEX_PREFIX, REGISTRY_KEY, "agg:", "meta:", "rule_trace")
+
+# Registers a record key and, only if it was not registered yet, increments its counters,
+# so re-loading the same security from several daily files does not count it twice.
+# KEYS: registry, aggregates hash. ARGV: record key, counter fields...
+_REGISTER_SCRIPT = Script(None, b"""
+if redis.call('ZADD', KEYS[1], 0, ARGV[1]) == 1 then
+    for i = 2, #ARGV do
+        redis.call('HINCRBY', KEYS[2], ARGV[i], 1)
+    end
+end
+return 0
+""")
+
+# Number of commands sent per pipeline by the batched readers.
+DEFAULT_BATCH_SIZE = 500
+
+# One connection pool per (host, port, db), shared by every loader thread. Commands (and
+# pipelines) are retried with exponential backoff on connection errors and timeouts.
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_client(host="localhost", port=6379, db=0, max_connections=64, retries=3, idempotent=True):
+    """
+    Returns a client on the process-wide connection pool for host:port/db. A timeout or a
+    dropped connection can come after the server applied the commands, so clients sending
+    writes that must not be repeated (e.g. RPUSH) pass idempotent=False: their pool never retries.
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get((host, port, db, idempotent))
+        if pool is None:
+            if idempotent:
+                retry = {"retry": Retry(ExponentialBackoff(cap=2, base=0.05), retries),
+                         "retry_on_error": [ConnectionError, TimeoutError]}
+            else:
+                retry = {}
+            pool = redis.ConnectionPool(host=host, port=port, db=db, max_connections=max_connections,
+                                        health_check_interval=30, **retry)
+            _POOLS[(host, port, db, idempotent)] = pool
+    return redis.Redis(connection_pool=pool)
+
+class AdaptiveBatchSize:
+    """
+    Number of records per pipeline flush, adjusted from the measured cost of each flush: it
+    doubles while flushes come back well within target_seconds and max_bytes, and halves when
+    one exceeds either, so the pipeline size follows the round-trip latency and record width.
+    """
+    def __init__(self, initial=100, minimum=10, maximum=5000, target_seconds=0.05, max_bytes=8 << 20):
+        self.size = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+        self.max_bytes = max_bytes
+
+    def update(self, records, nbytes, seconds):
+        if records < self.size:
+            return  # a short final flush says nothing about the pipeline size
+        if seconds > self.target_seconds or nbytes > self.max_bytes:
+            self.size = max(self.minimum, self.size // 2)
+        elif seconds < self.target_seconds / 2 and nbytes < self.max_bytes / 2:
+            self.size = min(self.maximum, self.size * 2)
+
+class MemoryGuard:
+    """
+    Backpressure on Redis memory: wait() blocks while used_memory is above high_water of
+    maxmemory (checked at most every check_interval seconds), so a load slows down instead of
+    running into evictions or OOM errors. Does nothing when maxmemory is not set or the server
+    does not allow INFO.
+    """
+    def __init__(self, r, high_water=0.9, check_interval=1.0, max_wait=600):
+        self.r = r
+        self.high_water = high_water
+        self.check_interval = check_interval
+        self.max_wait = max_wait
+        self._last_check = 0.0
+
+    def _usage(self):
+        try:
+            info = self.r.info("memory")
+        except ResponseError:
+            self.check_interval = float("inf")
+            return 0.0
+        maxmemory = info.get("maxmemory", 0)
+        return info["used_memory"] / maxmemory if maxmemory else 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        delay, waited = 0.1, 0.0
+        usage = self._usage()
+        while usage > self.high_water:
+            if waited >= self.max_wait:
+                raise RuntimeError(f"Redis memory still at {usage:.0%} of maxmemory after {waited:.0f}s")
+            print(f"Redis memory at {usage:.0%} of maxmemory, pausing the load.")
+            time.sleep(delay)
+            waited += delay
+            delay = min(delay * 2, 5.0)
+            usage = self._usage()
+        self._last_check = time.monotonic()
+
+def make_record_key(row, key_fields=KEY_FIELDS):
+    """Builds the record key by joining the stripped key field values with '|'."""
+    return "|".join(row.get(field, "").strip() for field in key_fields)
+
+def index_key(field, value):
+    """Returns the name of the set holding every record key whose `field` equals `value`."""
+    return f"{INDEX_PREFIX}{field}:{value}"
+
+def normalize_company_name(name):
+    """Company names are matched case-insensitively, ignoring surrounding whitespace."""
+    return name.strip().lower()
+
+def company_index_key(name):
+    """Returns the name of the set holding every record key of company `name` (any case)."""
+    return index_key("company_name_lower", normalize_company_name(name))
+
+def index_record(pipe, key, row):
+    """
+    Queues SADDs adding `key` to the index set of each indexed field of `row`
+    and to the case-insensitive company_name index.
+    """
+    for field in INDEXED_FIELDS:
+        value = row.get(field, "").strip()
+        if value:
+            pipe.sadd(index_key(field, value), key)
+    company_name = row.get("company_name", "")
+    if company_name.strip():
+        pipe.sadd(company_index_key(company_name), key)
+
+def register_record(pipe, key, row):
+    """
+    Queues the registration of `key` in the record registry, bumping the dashboard
+    counters of `row` if the key is new. `pipe` may also be a plain client.
+    """
+    counters = [aggregate_field(field, row.get(field) or "Unknown") for field in AGGREGATED_FIELDS]
+    _REGISTER_SCRIPT(keys=[REGISTRY_KEY, AGGREGATES_KEY], args=[key] + counters, client=pipe)
+
+def encode_record(row, encoding="plain"):
+    """Returns the hash fields storing `row` in the given encoding (see RECORD_ENCODINGS)."""
+    if encoding == "plain":
+        return row
+    fields = {field: value for field, value in row.items() if value != ""}
+    if encoding == "packed":
+        wide = {field: fields.pop(field) for field in list(fields) if field not in UNPACKED_FIELDS}
+        if wide:
+            fields[PACKED_FIELD] = zlib.compress(json.dumps(wide, separators=(",", ":")).encode("utf-8"))
+    return fields
+
+def decode_record(fields):
+    """
+    Returns a record read with HGETALL as {field: value} strings, whatever its encoding.
+    Columns omitted by the sparse encodings are absent rather than "".
+    """
+    record = {name.decode("utf-8"): value for name, value in fields.items()}
+    packed = record.pop(PACKED_FIELD, None)
+    record = {name: value.decode("utf-8") for name, value in record.items()}
+    if packed is not None:
+        record.update(_unpack(packed))
+    return record
+
+def _unpack(packed):
+    return json.loads(zlib.decompress(packed))
+
+class RecordWriter:
+    """
+    Writes records as hashes in the given encoding, registering and indexing each one, through
+    pipelines sized by an AdaptiveBatchSize (MULTI/EXEC ones for the sparse encodings). A MemoryGuard is consulted before each flush.
+    Keep one writer per loader thread (e.g. per file) so the batch size carries over.
+    Pass replace=True when the keys may already hold a record written in another encoding
+    (e.g. an incremental load), so its fields are not left behind.
+    """
+    def __init__(self, r, encoding="plain", batch_size=None, memory_guard=None, replace=False):
+        self.r = r
+        self.encoding = encoding
+        self.replace = replace
+        self.batch_size = batch_size or AdaptiveBatchSize()
+        self.memory_guard = memory_guard or MemoryGuard(r)
+
+    def write(self, items):
+        """Writes (key, row) pairs and returns the number written."""
+        # The sparse encodings (and a record stored in a different encoding) do not overwrite
+        # every field, so each record is deleted and rewritten; a transaction keeps readers from
+        # seeing it missing or half written.
+        rewrite = self.encoding != "plain" or self.replace
+        pipe = self.r.pipeline(transaction=rewrite)
+        count = pending = nbytes = 0
+        for key, row in items:
+            if rewrite:
+                pipe.delete(key)
+            fields = encode_record(row, self.encoding)
+            pipe.hset(key, mapping=fields)
+            register_record(pipe, key, row)
+            index_record(pipe, key, row)
+            nbytes += sum(len(value) for value in fields.values())
+            count += 1
+            pending += 1
+            if pending >= self.batch_size.size:
+                self._flush(pipe, pending, nbytes)
+                pending = nbytes = 0
+        if pending:
+            self._flush(pipe, pending, nbytes)
+        return count
+
+    def _flush(self, pipe, records, nbytes):
+        self.memory_guard.wait()
+        start = time.perf_counter()
+        pipe.execute()
+        self.batch_size.update(records, nbytes, time.perf_counter() - start)
+
+def store_records(r, rows, key_fields=KEY_FIELDS, encoding="plain", writer=None):
+    """
+    Writes `rows` as record hashes keyed by make_record_key (see RecordWriter). Pass `writer`
+    to reuse its adapted batch size across calls. Returns the number of rows written.
+    """
+    writer = writer or RecordWriter(r, encoding)
+    return writer.write((make_record_key(row, key_fields), row) for row in rows)
+
+def row_hash(row, date_field="applied_date"):
+    """
+    Returns the version stamp of `row`: its date followed by a digest of every field,
+    independent of the column order.
+    """
+    payload = json.dumps(row, sort_keys=True, separators=(",", ":"))
+    digest = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+    return f"{row.get(date_field, '')}:{digest}"
+
+def changed_rows(r, keys, hashes):
+    """
+    Returns the positions in `keys` whose row hash differs from the one stored by the previous
+    load (or that have none), with a single HMGET. Rows dated before the stored version are
+    older copies of it (e.g. from a previous daily file) and are not reported.
+    """
+    if not keys:
+        return []
+    changed = []
+    for i, (version, previous) in enumerate(zip(hashes, r.hmget(ROW_HASHES_KEY, keys))):
+        if previous is not None:
+            previous = previous.decode("utf-8")
+            if previous == version or previous.rsplit(":", 1)[0] > version.rsplit(":", 1)[0]:
+                continue
+        changed.append(i)
+    return changed
+
+def save_row_hashes(r, hashes, batch_size=DEFAULT_BATCH_SIZE):
+    """Stores {record key: row hash} for the rows a load has written to every store."""
+    items = list(hashes.items())
+    for i in range(0, len(items), batch_size):
+        r.hset(ROW_HASHES_KEY, mapping=dict(items[i:i + batch_size]))
+
+def aggregate_field(field, value):
+    """Returns the AGGREGATES_KEY field counting records whose `field` equals `value`."""
+    return f"{field}:{value}"
+
+def read_aggregates(r):
+    """Returns the dashboard counters as {field: {value: count}} with a single HGETALL."""
+    aggregates = {field: {} for field in AGGREGATED_FIELDS}
+    for name, count in r.hgetall(AGGREGATES_KEY).items():
+        field, value = name.decode("utf-8").split(":", 1)
+        aggregates.setdefault(field, {})[value] = int(count)
+    return aggregates
+
+def rebuild_aggregates(r, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Recomputes the dashboard counters from the stored records and replaces them atomically.
+    Returns the number of records counted.
+    """
+    counts = defaultdict(int)
+    total = 0
+    for record in fetch_records(r, iter_record_keys(r), AGGREGATED_FIELDS, batch_size):
+        for field in AGGREGATED_FIELDS:
+            counts[aggregate_field(field, record[field] or "Unknown")] += 1
+        total += 1
+    pipe = r.pipeline(transaction=True)
+    pipe.delete(AGGREGATES_KEY)
+    if counts:
+        pipe.hset(AGGREGATES_KEY, mapping=counts)
+    pipe.execute()
+    return total
+
+def bump_generation(r):
+    """
+    Marks the end of a load by storing a new generation token. The token is time based rather
+    than an INCR counter, so it stays unique across the flushdb at the start of a full reload.
+    """
+    generation = str(time.time_ns())
+    r.set(GENERATION_KEY, generation)
+    return generation
+
+def promote_staging_db(staging, staging_db, live_db=0):
+    """
+    Makes the data loaded into `staging_db` live with a single SWAPDB, after giving it a new
+    generation token, then empties the staging db (now holding the previous data) in the
+    background. `staging` is a client on staging_db. Readers of live_db see either the previous
+    data set or the new one, never a partial load.
+    """
+    generation = bump_generation(staging)
+    staging.swapdb(staging_db, live_db)
+    staging.flushdb(asynchronous=True)
+    return generation
+
+def get_generation(r):
+    """Returns the current generation token, or None while a full reload is in progress."""
+    generation = r.get(GENERATION_KEY)
+    return generation.decode("utf-8") if generation is not None else None
+
+def is_record_key(key):
+    """Returns True if `key` (bytes or str) names a security record rather than loader metadata."""
+    if isinstance(key, bytes):
+        key = key.decode("utf-8")
+    return not key.startswith(RESERVED_PREFIXES)
+
+def iter_record_keys(r, count=1000):
+    """SCANs the db and yields only record keys."""
+    for key in r.scan_iter("*", count=count):
+        if is_record_key(key):
+            yield key
+
+def rule_trace_key(record_key):
+    """Returns the name of the list holding the rule engine issues of a security."""
+    return f"{RULE_TRACE_PREFIX}security:{_to_str(record_key)}"
+
+def rule_trace_date_key(applied_date):
+    """Returns the name of the set of securities with rule engine issues on `applied_date`."""
+    return f"{RULE_TRACE_PREFIX}date:{applied_date}"
+
+def index_rule_trace_issue(pipe, issue):
+    """
+    Queues the indexing of one rule engine issue (a row of a rule_trace report). Its UniqueKey
+    is the record key followed by "|<applied date>".
+    """
+    record_key, _, applied_date = issue.get("UniqueKey", "").rpartition("|")
+    pipe.rpush(rule_trace_key(record_key), json.dumps(issue))
+    pipe.sadd(rule_trace_date_key(applied_date), record_key)
+
+def read_rule_trace(r, record_key, applied_date=None):
+    """Returns the rule engine issues of a security, optionally only those of one applied date."""
+    issues = [json.loads(issue) for issue in r.lrange(rule_trace_key(record_key), 0, -1)]
+    if applied_date:
+        issues = [issue for issue in issues if issue.get("UniqueKey", "").endswith(f"|{applied_date}")]
+    return issues
+
+def find_keys_by_fields(r, filters):
+    """
+    Returns the set of record keys matching every (field, value) pair in `filters`
+    by intersecting the index sets. All filtered fields must be in INDEXED_FIELDS.
+    """
+    return r.sinter([index_key(field, value) for field, value in filters.items()])
+
+def page_registry(r, start=0, limit=100, cursor=None):
+    """
+    Returns (keys, total) for one page of the record registry.
+    With `cursor` (the last key of the previous page) the page starts right after it,
+    otherwise at offset `start`.
+    """
+    if cursor:
+        keys = r.zrangebylex(REGISTRY_KEY, b"(" + _to_bytes(cursor), b"+", start=0, num=limit)
+    else:
+        keys = r.zrange(REGISTRY_KEY, start, start + limit - 1)
+    return keys, r.zcard(REGISTRY_KEY)
+
+def page_keys(keys, start=0, limit=100, cursor=None):
+    """Same paging contract as page_registry, applied to an in-memory set of keys."""
+    keys = sorted(_to_bytes(key) for key in keys)
+    if cursor:
+        cursor = _to_bytes(cursor)
+        page = [key for key in keys if key > cursor][:limit]
+    else:
+        page = keys[start:start + limit]
+    return page, len(keys)
+
+def fetch_records(r, keys, fields, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Reads only `fields` of each record in `keys` with HMGET, `batch_size` commands per pipeline.
+    `keys` may be any iterable (e.g. iter_record_keys); records are yielded in the same order,
+    one pipeline at a time, as {field: value} with missing fields as "". Fields stored in the
+    packed encoding are read from PACKED_FIELD.
+    """
+    fields = list(fields)
+    unpack = any(field not in UNPACKED_FIELDS for field in fields)
+    requested = fields + [PACKED_FIELD] if unpack else fields
+    pipe = r.pipeline(transaction=False)
+    batch = []
+    for key in keys:
+        pipe.hmget(key, requested)
+        batch.append(key)
+        if len(batch) >= batch_size:
+            yield from _decode_projected(fields, pipe.execute(), unpack)
+            batch = []
+    if batch:
+        yield from _decode_projected(fields, pipe.execute(), unpack)
+
+def _decode_projected(fields, results, unpack=False):
+    for values in results:
+        record = {field: value.decode("utf-8") if value is not None else "" for field, value in zip(fields, values)}
+        if unpack and values[-1] is not None:
+            packed = _unpack(values[-1])
+            for field in fields:
+                if field in packed:
+                    record[field] = packed[field]
+        yield record
+
+def _to_str(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+def _to_bytes(value):
+    return value if isinstance(value, bytes) else value.encode("utf-8")
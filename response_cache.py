@@ -0,0 +1,47 @@
+import threading
+from collections import OrderedDict
+
+class ResponseCache:
+    """
+    In-process LRU cache of serialized response bodies, bounded by their total size in bytes.
+
+    Entries are stamped with the Redis load generation they were computed from. The first
+    lookup or store under a new generation drops everything cached under the previous one,
+    so a finished load invalidates the whole cache at once.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.generation = None
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_generation(self, generation):
+        if generation != self.generation:
+            self._entries.clear()
+            self.size = 0
+            self.generation = generation
+
+    def get(self, generation, key):
+        """Returns the cached body for `key` under `generation`, or None."""
+        with self._lock:
+            self._check_generation(generation)
+            payload = self._entries.get(key)
+            if payload is not None:
+                self._entries.move_to_end(key)
+            return payload
+
+    def put(self, generation, key, payload):
+        """Caches `payload` (bytes), evicting least recently used entries to stay within max_bytes."""
+        if len(payload) > self.max_bytes:
+            return
+        with self._lock:
+            self._check_generation(generation)
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._entries[key] = payload
+            self.size += len(payload)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
@@ -0,0 +1,329 @@
+"""
+Rule engine checking the security identifier fields of inventory and SOI files.
+
+The patterns are compiled once and rows are evaluated a chunk at a time: the checked fields
+of a row are first matched together against one combined pattern, and only the rows it
+rejects are checked field by field, one column at a time. The UniqueKey of a row is only
+built when the row has an issue. Identifiers matching their pattern then have their check
+digit verified (see check_digits.py: the published algorithms by default, SOIGenerator's
+for generated data). Used by the generators' rule trace reports
+(gen_x.py, gen_y.py) and by the /upload_soi check in app.py. Several reports (or one large
+file) can be checked on a process pool with run_rule_engine_parallel.
+"""
+
+import collections
+import csv
+import io
+import operator
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from check_digits import FAILURES, SCHEMES
+from csv_pipeline import batched
+
+# Expected patterns of the four security key fields.
+PATTERNS = {
+    "FIGI": r"^BBG[A-Z0-9]{8}\d$",
+    "CUSIP": r"^[A-Z0-9*@#]{9}$",
+    "SEDOL": r"^[A-Z0-9]{7}$",
+    "ISIN": r"^[A-Z]{2}[A-Z0-9]{9}\d$"
+}
+
+# Fields joined with "|" into the UniqueKey of a reported row.
+UNIQUE_KEY_FIELDS = ["FIGI", "CUSIP", "SEDOL", "ISIN", "COMPANY_NAME", "CURRENCY", "ASSET_CLASS", "ASSET_GROUP",
+                     "APPLIED_DATE"]
+
+REPORT_FIELDS = ["RowNumber", "UniqueKey", "Field", "FieldValue", "Issue", "Message"]
+
+# Rows evaluated per chunk.
+DEFAULT_CHUNK_SIZE = 10000
+
+# Bytes of a file checked by one task of run_rule_engine_parallel.
+DEFAULT_RANGE_BYTES = 32 << 20
+
+class RuleEngine:
+    """
+    Checks each pattern field of a row: an empty (or blank) value is a Warning, one that does
+    not match its pattern is an Error, and so is one whose check digit is wrong (for the
+    fields in `check_digits`, {field: column check}, see check_digits.FAILURES; pass {} to
+    skip these). With strip=True values are stripped before they are checked and reported;
+    with warn_empty=False empty values are not reported.
+    """
+    def __init__(self, patterns=PATTERNS, key_fields=UNIQUE_KEY_FIELDS, strip=False, warn_empty=True,
+                 check_digits=FAILURES):
+        self.fields = list(patterns)
+        self.matchers = [re.compile(pattern).match for pattern in patterns.values()]
+        # All the fields joined with "\x1f" match this only if each of them matches its own
+        # pattern, so it can only let through rows without issues.
+        self.row_matcher = None
+        if len(patterns) > 1 and all(pattern.startswith("^") and pattern.endswith("$") for pattern in patterns.values()):
+            combined = "\x1f".join(f"(?:{pattern[1:-1]})" for pattern in patterns.values())
+            self.row_matcher = re.compile(combined + r"\Z").match
+        self.messages = [f"Value does not match expected pattern for {field}." for field in self.fields]
+        self.check_digits = [check_digits.get(field) for field in self.fields]
+        self.check_messages = [f"Check digit does not match for {field}." for field in self.fields]
+        self.key_fields = key_fields
+        self.strip = strip
+        self.warn_empty = warn_empty
+        self._bindings = {}
+
+    def _bind(self, header):
+        """
+        Returns (column position of each checked field, UniqueKey function, minimum row width)
+        for `header`, cached per header so one engine can be shared between threads.
+        """
+        header = tuple(header)
+        binding = self._bindings.get(header)
+        if binding is None:
+            positions = [header.index(field) if field in header else None for field in self.fields]
+            key_positions = [header.index(field) if field in header else None for field in self.key_fields]
+            if None in key_positions or len(key_positions) < 2:
+                get_key = lambda row: [row[i] if i is not None else "" for i in key_positions]
+            else:
+                get_key = operator.itemgetter(*key_positions)
+            if self.strip:
+                key = lambda row: "|".join(value.strip() for value in get_key(row))
+            else:
+                key = lambda row: "|".join(get_key(row))
+            width = max([i for i in positions + key_positions if i is not None], default=-1) + 1
+            binding = self._bindings[header] = (positions, key, width)
+        return binding
+
+    def evaluate(self, header, rows, first_row_number=1):
+        """
+        Returns the issues of a chunk of rows (lists of values in `header` order), ordered by
+        row and then field, as dicts with the REPORT_FIELDS keys. Rows are numbered from
+        first_row_number.
+        """
+        positions, key, width = self._bind(header)
+        if any(len(row) < width for row in rows):
+            # Short (malformed) rows read as empty in their missing columns.
+            rows = [row + [""] * (width - len(row)) if len(row) < width else row for row in rows]
+        if self.row_matcher is not None and None not in positions:
+            values = operator.itemgetter(*positions)
+            join = "\x1f".join
+            match = self.row_matcher
+            if self.strip:
+                candidates = [i for i, row in enumerate(rows) if not match(join(value.strip() for value in values(row)))]
+            else:
+                candidates = [i for i, row in enumerate(rows) if not match(join(values(row)))]
+        else:
+            candidates = range(len(rows))
+        found = []
+        for field_index, (position, match) in enumerate(zip(positions, self.matchers)):
+            rejected = set()
+            for i in candidates:
+                value = rows[i][position] if position is not None else ""
+                if self.strip:
+                    value = value.strip()
+                if match(value):
+                    continue
+                rejected.add(i)
+                if not value.strip():
+                    if self.warn_empty:
+                        found.append((i, field_index, value, "Warning", "Field is empty."))
+                else:
+                    found.append((i, field_index, value, "Error", self.messages[field_index]))
+            failures = self.check_digits[field_index]
+            if failures is not None and position is not None:
+                column = [row[position] for row in rows]
+                if self.strip:
+                    column = [value.strip() for value in column]
+                found.extend((i, field_index, column[i], "Error", self.check_messages[field_index])
+                             for i in failures(column, rejected))
+        found.sort(key=operator.itemgetter(0, 1))
+        issues = []
+        keys = {}
+        for i, field_index, value, issue, message in found:
+            if i not in keys:
+                keys[i] = key(rows[i])
+            issues.append({
+                "RowNumber": first_row_number + i,
+                "UniqueKey": keys[i],
+                "Field": self.fields[field_index],
+                "FieldValue": value,
+                "Issue": issue,
+                "Message": message
+            })
+        return issues
+
+    def iter_issues(self, reader, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Evaluates the rows of a csv.reader (header first) chunk by chunk and yields
+        (rows in the chunk, issues of the chunk). Blank lines are skipped, as csv.DictReader does.
+        """
+        header = next(reader, [])
+        row_number = 1
+        for chunk in batched((row for row in reader if row), chunk_size):
+            yield len(chunk), self.evaluate(header, chunk, row_number)
+            row_number += len(chunk)
+
+def run_rule_engine(inventory_filename, report_filename, engine=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Checks every row of an inventory CSV file and writes the issues to a report CSV file with
+    the REPORT_FIELDS columns. Returns the number of issues.
+    """
+    engine = engine or RuleEngine()
+    count = 0
+    with open(inventory_filename, newline="", encoding="utf-8") as infile, \
+            open(report_filename, "w", newline="", encoding="utf-8") as outfile:
+        writer = csv.DictWriter(outfile, fieldnames=REPORT_FIELDS)
+        writer.writeheader()
+        for _, issues in engine.iter_issues(csv.reader(infile), chunk_size):
+            writer.writerows(issues)
+            count += len(issues)
+    print(f"Rule engine report generated: {report_filename}")
+    return count
+
+def split_ranges(filename, range_bytes=DEFAULT_RANGE_BYTES):
+    """
+    Returns the header of a CSV file and the (start, end) byte ranges covering it, each about
+    range_bytes long and ending after a newline (the first one holds the header). A range can
+    still end inside a quoted field; _evaluate_range detects that.
+    """
+    with open(filename, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), [])
+    ranges = []
+    with open(filename, "rb") as f:
+        start = 0
+        while True:
+            block = f.read(range_bytes)
+            if not block:
+                break
+            if not block.endswith(b"\n"):
+                f.readline()
+            ranges.append((start, f.tell()))
+            start = f.tell()
+    return header, ranges or [(0, 0)]
+
+# Appended to a range as a record of its own: the parser only returns it as one if the range
+# ended between records rather than inside a quoted field.
+_RANGE_END = "\x1eend of range\x1e"
+
+# Rule engines of a worker process by check digit scheme, created on their first task.
+_engines = {}
+
+def _evaluate_range(filename, header, start, end, last, chunk_size, check_digits):
+    """
+    Returns (rows, issues) of a byte range of a CSV file, the rows numbered from 1, skipping
+    the header in the range starting the file. issues is None if the range (other than the
+    last one) ends inside a quoted field, i.e. before the end of its last record.
+    """
+    engine = _engines.get(check_digits)
+    if engine is None:
+        engine = _engines[check_digits] = RuleEngine(check_digits=SCHEMES[check_digits])
+    with open(filename, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8")
+    if not last:
+        text += "\r\n" + _RANGE_END + "\r\n"
+    reader = csv.reader(io.StringIO(text, newline=""))
+    if start == 0:
+        next(reader, None)
+    ended = {"clean": last}
+
+    def records():
+        rows = (row for row in reader if row)
+        held = next(rows, None)
+        for row in rows:
+            yield held
+            held = row
+        if last:
+            if held is not None:
+                yield held
+        else:
+            ended["clean"] = held == [_RANGE_END]
+
+    issues = []
+    row_number = 1
+    for chunk in batched(records(), chunk_size):
+        issues.extend(engine.evaluate(header, chunk, row_number))
+        row_number += len(chunk)
+    return row_number - 1, issues if ended["clean"] else None
+
+def parallel_issues(filenames, executor, max_pending, range_bytes=DEFAULT_RANGE_BYTES, chunk_size=DEFAULT_CHUNK_SIZE,
+                    check_digits="published"):
+    """
+    Checks CSV files on `executor` (a ProcessPoolExecutor), one task per byte range of a file
+    (see split_ranges), and yields (index of the file, issues of the range) in file and row
+    order, so each file gets the issues RuleEngine().iter_issues finds, in the same order.
+    A range ending inside a quoted field is checked again together with the next one.
+    check_digits names the check digit scheme (see check_digits.SCHEMES). At most
+    max_pending tasks are queued at a time.
+    """
+    def submit(index, filename, header, start, end, last):
+        future = executor.submit(_evaluate_range, filename, header, start, end, last, chunk_size, check_digits)
+        return index, filename, header, start, end, last, future
+
+    def tasks():
+        for index, filename in enumerate(filenames):
+            header, ranges = split_ranges(filename, range_bytes)
+            for start, end in ranges:
+                yield submit(index, filename, header, start, end, end == ranges[-1][1])
+
+    queued = tasks()
+    pending = collections.deque()
+    rows_before = collections.Counter()
+
+    def collect():
+        index, filename, header, start, end, last, future = pending.popleft()
+        rows, issues = future.result()
+        merge = 1
+        while issues is None:
+            # The last record goes on in the following ranges of the file (the range is not the
+            # file's last one). Take in twice as many each time, so a record spanning many
+            # ranges costs at most twice a serial check.
+            for _ in range(merge):
+                if not pending:
+                    pending.append(next(queued))
+                following = pending.popleft()
+                following[-1].cancel()
+                end, last = following[4], following[5]
+                if last:
+                    break
+            merge *= 2
+            rows, issues = submit(index, filename, header, start, end, last)[-1].result()
+        if rows_before[index]:
+            for issue in issues:
+                issue["RowNumber"] += rows_before[index]
+        rows_before[index] += rows
+        return index, issues
+
+    for task in queued:
+        pending.append(task)
+        while len(pending) >= max_pending:
+            yield collect()
+    while pending:
+        yield collect()
+
+def run_rule_engine_parallel(jobs, max_workers=None, range_bytes=DEFAULT_RANGE_BYTES, chunk_size=DEFAULT_CHUNK_SIZE,
+                             check_digits="published"):
+    """
+    run_rule_engine for each (inventory_filename, report_filename) of `jobs` on a pool of
+    max_workers processes (default: one per CPU), large files split into ranges of about
+    range_bytes, verifying check digits with the named scheme (see check_digits.SCHEMES). The reports are written in order and are identical to the serial ones.
+    Returns the number of issues of each report.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    counts = [0] * len(jobs)
+    current, outfile, writer = None, None, None
+    with ProcessPoolExecutor(max_workers) as executor:
+        try:
+            for index, issues in parallel_issues([inventory for inventory, _ in jobs], executor, 4 * max_workers,
+                                                 range_bytes, chunk_size, check_digits):
+                if index != current:
+                    if outfile is not None:
+                        outfile.close()
+                        print(f"Rule engine report generated: {jobs[current][1]}")
+                    current = index
+                    outfile = open(jobs[index][1], "w", newline="", encoding="utf-8")
+                    writer = csv.DictWriter(outfile, fieldnames=REPORT_FIELDS)
+                    writer.writeheader()
+                writer.writerows(issues)
+                counts[index] += len(issues)
+        finally:
+            if outfile is not None:
+                outfile.close()
+    if current is not None:
+        print(f"Rule engine report generated: {jobs[current][1]}")
+    return counts
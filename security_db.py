@@ -0,0 +1,228 @@
+"""
+Postgres access to the security master tables, shared by app.py and app2.py.
+
+Connections come from a thread-safe pool and are reused across requests. The lookups
+by the 8 key fields are PREPAREd once per pooled connection, so later calls only
+send EXECUTE with the key values.
+"""
+
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2.pool import PoolError, ThreadedConnectionPool
+
+KEY_FIELDS = ["figi", "cusip", "sedol", "isin", "company_name", "currency", "asset_class", "asset_group"]
+
+# Identifier columns that get their own index for single-identifier lookups.
+IDENTIFIER_FIELDS = ["figi", "cusip", "sedol", "isin"]
+
+def _index_suffixes(identifier_fields=IDENTIFIER_FIELDS):
+    return ["key_date_idx"] + [f"{field.lower()}_idx" for field in identifier_fields]
+
+def index_statements(table_name="security_master", key_fields=KEY_FIELDS, date_field="applied_date",
+                     identifier_fields=IDENTIFIER_FIELDS):
+    """
+    Returns the CREATE INDEX statements for a security master table: one composite index on
+    the key fields plus the date (serving the latest / versions / by-date lookups, newest
+    first by scanning it backwards) and one index per identifier column.
+    Run them after a bulk load, followed by ANALYZE, rather than before it.
+    """
+    key_date_idx, *identifier_idxs = _index_suffixes(identifier_fields)
+    columns = ", ".join(f'"{field}"' for field in key_fields + [date_field])
+    statements = [f"CREATE INDEX IF NOT EXISTS {table_name}_{key_date_idx} ON {table_name} ({columns});"]
+    for field, suffix in zip(identifier_fields, identifier_idxs):
+        statements.append(f'CREATE INDEX IF NOT EXISTS {table_name}_{suffix} ON {table_name} ("{field}");')
+    statements.append(f"ANALYZE {table_name};")
+    return statements
+
+def swap_statements(table_name, staging_table, identifier_fields=IDENTIFIER_FIELDS):
+    """
+    Returns the statements replacing `table_name` with `staging_table`, a fully loaded and
+    indexed copy, and dropping the previous table. The indexes are renamed along with the tables
+    so the next staging load can reuse the staging names. Run them in one transaction: readers
+    keep seeing the previous table until COMMIT, then see the new one.
+    """
+    previous_table = f"{table_name}_previous"
+    suffixes = _index_suffixes(identifier_fields)
+    statements = [f"DROP TABLE IF EXISTS {previous_table};",
+                  f"ALTER TABLE IF EXISTS {table_name} RENAME TO {previous_table};"]
+    statements += [f"ALTER INDEX IF EXISTS {table_name}_{suffix} RENAME TO {previous_table}_{suffix};" for suffix in suffixes]
+    statements.append(f"ALTER TABLE {staging_table} RENAME TO {table_name};")
+    statements += [f"ALTER INDEX IF EXISTS {staging_table}_{suffix} RENAME TO {table_name}_{suffix};" for suffix in suffixes]
+    statements.append(f"DROP TABLE IF EXISTS {previous_table};")
+    return statements
+
+class _PreparingConnection(psycopg2.extensions.connection):
+    """Connection that remembers which statements have been PREPAREd on its session."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+class SecurityMasterDB:
+    def __init__(self, dsn, table_name="security_master", key_fields=KEY_FIELDS,
+                 date_field="applied_date", distinct_dates=True, minconn=1, maxconn=10, pool_timeout=30):
+        """
+        dsn: libpq connection string, e.g. "dbname=postgres user=jez host=localhost port=5432".
+        table_name / key_fields / date_field: the table layout (app.py uses lower case
+            columns in security_master, app2.py upper case columns in dummy_security_master).
+        distinct_dates: return at most one version per date from get_all_versions.
+        minconn / maxconn: pool size. The pool is only created on first use, so the apps
+            can start while Postgres is down.
+        pool_timeout: seconds a request waits for a free connection when all maxconn are in
+            use, before PoolError is raised.
+        """
+        self.dsn = dsn
+        self.table_name = table_name
+        self.key_fields = key_fields
+        self.date_field = date_field
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.pool_timeout = pool_timeout
+        # ThreadedConnectionPool.getconn raises as soon as maxconn connections are out, so
+        # borrowers queue on this first.
+        self._available = threading.BoundedSemaphore(maxconn)
+
+        where_clause = " AND ".join(f'"{field}" = ${i}' for i, field in enumerate(key_fields, start=1))
+        date_param = f"${len(key_fields) + 1}"
+        distinct = f'DISTINCT ON ("{date_field}") ' if distinct_dates else ""
+        # name -> (number of parameters, statement)
+        self.statements = {
+            "latest": (len(key_fields), f"""
+                SELECT * FROM {table_name}
+                WHERE {where_clause}
+                ORDER BY "{date_field}" DESC LIMIT 1"""),
+            "versions": (len(key_fields), f"""
+                SELECT {distinct}* FROM {table_name}
+                WHERE {where_clause}
+                ORDER BY "{date_field}" DESC"""),
+            # All versions, newest first, each with the days to the previous version and its age
+            # in days. Dates that are not valid YYYY-MM-DD strings give NULL gaps: the day is
+            # added to the first of the month, which cannot fail, and impossible dates such as
+            # 2025-02-30 (which ::date would raise on) do not format back to the same string.
+            "detail": (len(key_fields), f"""
+                WITH versions AS (
+                    SELECT {distinct}* FROM {table_name}
+                    WHERE {where_clause}
+                ), candidates AS (
+                    SELECT versions.*,
+                           CASE WHEN "{date_field}" ~ '^\\d{{4}}-(0[1-9]|1[0-2])-(0[1-9]|[12]\\d|3[01])$'
+                                     AND "{date_field}" >= '0001'
+                                THEN make_date(substr("{date_field}", 1, 4)::int, substr("{date_field}", 6, 2)::int, 1)
+                                     + (substr("{date_field}", 9, 2)::int - 1) END AS _date_candidate
+                    FROM versions
+                ), dated AS (
+                    SELECT candidates.*,
+                           CASE WHEN to_char(_date_candidate, 'YYYY-MM-DD') = "{date_field}"
+                                THEN _date_candidate END AS _parsed_date
+                    FROM candidates
+                )
+                SELECT dated.*,
+                       abs(_parsed_date - lead(_parsed_date) OVER (ORDER BY "{date_field}" DESC)) AS _days_since_last_update,
+                       abs(current_date - _parsed_date) AS _age
+                FROM dated
+                ORDER BY "{date_field}" DESC"""),
+            "by_date": (len(key_fields) + 1, f"""
+                SELECT * FROM {table_name}
+                WHERE {where_clause} AND "{date_field}" = {date_param}
+                LIMIT 1"""),
+        }
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ThreadedConnectionPool(self.minconn, self.maxconn, self.dsn,
+                                                        connection_factory=_PreparingConnection)
+        return self._pool
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a pooled connection (in autocommit mode), waiting up to pool_timeout seconds
+        for one to be returned if all are in use; broken connections are discarded on return.
+        """
+        if not self._available.acquire(timeout=self.pool_timeout):
+            raise PoolError(f"no connection available after {self.pool_timeout}s")
+        try:
+            pool = self._get_pool()
+            conn = pool.getconn()
+            try:
+                conn.autocommit = True
+                yield conn
+            finally:
+                pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._available.release()
+
+    def close(self):
+        """Closes every pooled connection."""
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+    def _prepare(self, cur, name):
+        nparams, sql = self.statements[name]
+        cur.execute(f"PREPARE {self.table_name}_{name} ({', '.join(['text'] * nparams)}) AS {sql}")
+        cur.connection.prepared.add(name)
+
+    def _execute(self, name, values):
+        """Runs prepared statement `name` and returns (column names, rows)."""
+        with self.connection() as conn:
+            with conn.cursor() as cur:
+                if name not in conn.prepared:
+                    self._prepare(cur, name)
+                placeholders = ", ".join(["%s"] * len(values))
+                execute_sql = f"EXECUTE {self.table_name}_{name} ({placeholders})"
+                try:
+                    cur.execute(execute_sql, values)
+                except (psycopg2.errors.FeatureNotSupported, psycopg2.errors.InvalidSqlStatementName):
+                    # The table was recreated with different columns since the statement was
+                    # prepared (or the session lost it): prepare it again and retry once.
+                    cur.execute("DEALLOCATE ALL")
+                    conn.prepared.clear()
+                    self._prepare(cur, name)
+                    cur.execute(execute_sql, values)
+                colnames = [desc[0] for desc in cur.description]
+                return colnames, cur.fetchall()
+
+    def _key_values(self, params):
+        return [params.get(field, "") for field in self.key_fields]
+
+    def get_latest_record(self, params):
+        """Returns the latest record (by date) matching the key fields in `params`, or {}."""
+        colnames, rows = self._execute("latest", self._key_values(params))
+        return dict(zip(colnames, rows[0])) if rows else {}
+
+    def get_all_versions(self, params):
+        """Returns every version matching the key fields in `params`, newest first."""
+        colnames, rows = self._execute("versions", self._key_values(params))
+        return [dict(zip(colnames, row)) for row in rows]
+
+    def get_record_by_date(self, params, applied_date):
+        """Returns the version matching the key fields in `params` on `applied_date`, or {}."""
+        colnames, rows = self._execute("by_date", self._key_values(params) + [applied_date])
+        return dict(zip(colnames, rows[0])) if rows else {}
+
+    def get_security_detail(self, params):
+        """
+        Returns (record, versions) for the detail page from a single query: every version
+        (newest first) and the latest one, with "days_since_last_update" (days between the
+        two newest versions) and "age" (days since the newest version) added to the record,
+        "N/A" where they cannot be computed. record is {} if nothing matches.
+        """
+        colnames, rows = self._execute("detail", self._key_values(params))
+        if not rows:
+            return {}, []
+        computed = {"_date_candidate", "_parsed_date", "_days_since_last_update", "_age"}
+        versions = [{k: v for k, v in zip(colnames, row) if k not in computed} for row in rows]
+        latest = dict(zip(colnames, rows[0]))
+        record = dict(versions[0])
+        gap, age = latest["_days_since_last_update"], latest["_age"]
+        record["days_since_last_update"] = gap if gap is not None else "N/A"
+        record["age"] = age if age is not None else "N/A"
+        return record, versions
@@ -0,0 +1,167 @@
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from check_digits import SCHEMES
+from issue_spool import IssueSpool
+from rule_engine import RuleEngine
+
+# SOI uploads report pattern and check digit errors only, keyed by the four identifiers
+SOI_KEY_FIELDS = ["FIGI", "CUSIP", "SEDOL", "ISIN"]
+
+_JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# Progress queue of a worker process, set by _init_worker.
+_progress = None
+
+def validate_soi(stream, spool, preview_size, on_progress=None, check_digits="soi"):
+    """
+    Checks the rows of an SOI file (a text stream) a chunk at a time, spooling every issue to
+    `spool`, and returns the summary: row, error-row and issue counts, per-field issue counts
+    and the first preview_size issues. on_progress(summary so far) is called after each chunk.
+    check_digits names the check digit scheme (see check_digits.SCHEMES); SOI files are
+    written by SOIGenerator, so its scheme is the default.
+    """
+    engine = RuleEngine(key_fields=SOI_KEY_FIELDS, strip=True, warn_empty=False, check_digits=SCHEMES[check_digits])
+    summary = {"totalRows": 0, "errorCount": 0, "issueCount": 0, "fieldCounts": {}, "errorData": []}
+    for rows, issues in engine.iter_issues(csv.reader(stream)):
+        summary["totalRows"] += rows
+        summary["errorCount"] += len({issue["RowNumber"] for issue in issues})
+        for issue in issues:
+            summary["fieldCounts"][issue["Field"]] = summary["fieldCounts"].get(issue["Field"], 0) + 1
+        summary["errorData"].extend(issues[:preview_size - len(summary["errorData"])])
+        spool.append(issues)
+        summary["issueCount"] = spool.count
+        if on_progress:
+            on_progress(summary)
+    summary["errorDataTruncated"] = spool.count > len(summary["errorData"])
+    return summary
+
+def report_path(directory, job_id):
+    return os.path.join(directory, job_id + ".json")
+
+def read_report(directory, job_id):
+    """Returns the stored final state of a job, or None."""
+    try:
+        with open(report_path(directory, job_id), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _init_worker(progress):
+    global _progress
+    _progress = progress
+
+def run_job(job_id, upload_path, directory, preview_size, check_digits="soi"):
+    """
+    Validates an uploaded SOI file in a worker process. Progress goes to the queue given to
+    the pool; the final state ("done" with the summary, or "failed") is also written to
+    <directory>/<job_id>.json. The upload is removed afterwards.
+    """
+    def report(state):
+        state["jobId"] = job_id
+        _progress.put(state)
+
+    spool = IssueSpool(directory, job_id)
+    total_bytes = os.path.getsize(upload_path)
+    try:
+        with open(upload_path, "rb") as raw:
+            # utf-8-sig also reads files without a BOM
+            stream = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
+            def on_progress(summary):
+                report({"status": "running", "rows": summary["totalRows"], "errorCount": summary["errorCount"],
+                        "issueCount": summary["issueCount"], "progress": raw.tell() / total_bytes if total_bytes else 1.0})
+            summary = validate_soi(stream, spool, preview_size, on_progress, check_digits)
+        spool.close()
+        if not spool.count:
+            spool.discard()
+        state = {"status": "done", "summary": dict(summary, uploadId=job_id if spool.count else None)}
+    except (UnicodeDecodeError, csv.Error) as e:
+        spool.discard()
+        state = {"status": "failed", "error": "File decoding error", "details": str(e)}
+    finally:
+        os.remove(upload_path)
+    state["jobId"] = job_id
+    tmp_path = report_path(directory, job_id) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, report_path(directory, job_id))
+    _progress.put({"jobId": job_id, "status": state["status"]})
+
+class SoiJobRunner:
+    """
+    Runs SOI validation jobs on a process pool, so a request only has to save the upload.
+    Progress messages from the workers are relayed to emit(state) by a background task
+    (start_background_task, e.g. SocketIO.start_background_task), and the latest state of
+    each job is kept for status requests.
+    """
+    def __init__(self, directory, max_workers, emit, start_background_task, preview_size=1000, check_digits="soi"):
+        self.directory = directory
+        self.max_workers = max_workers
+        self.emit = emit
+        self.start_background_task = start_background_task
+        self.preview_size = preview_size
+        self.check_digits = check_digits
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _start(self):
+        # spawn: the workers must not inherit the server's threads and sockets
+        context = multiprocessing.get_context("spawn")
+        self._queue = context.Queue()
+        self._executor = ProcessPoolExecutor(self.max_workers, mp_context=context, initializer=_init_worker,
+                                             initargs=(self._queue,))
+        self.start_background_task(self._relay)
+
+    def _relay(self):
+        while True:
+            state = self._queue.get()
+            with self._lock:
+                if state["jobId"] in self.jobs:
+                    self.jobs[state["jobId"]] = dict(state, updated=time.time())
+            self.emit(state)
+
+    def submit(self, job_id, upload_path):
+        """Queues the validation of a saved upload; the upload is removed when the job ends."""
+        with self._lock:
+            if self._executor is None:
+                self._start()
+            self.jobs[job_id] = {"jobId": job_id, "status": "queued", "updated": time.time()}
+        future = self._executor.submit(run_job, job_id, upload_path, self.directory, self.preview_size,
+                                       self.check_digits)
+        future.add_done_callback(lambda f: self._finished(job_id, upload_path, f))
+
+    def _finished(self, job_id, upload_path, future):
+        if future.exception() is not None:
+            if os.path.exists(upload_path):
+                os.remove(upload_path)
+            # The worker died or the job raised before reporting its final state
+            state = {"jobId": job_id, "status": "failed", "error": "Validation failed",
+                     "details": str(future.exception())}
+            with self._lock:
+                self.jobs[job_id] = dict(state, updated=time.time())
+            self.emit(state)
+
+    def status(self, job_id):
+        """Returns the state of a job ("queued", "running", "done" with its summary, "failed"), or None."""
+        if not _JOB_ID.match(job_id):
+            return None
+        with self._lock:
+            state = self.jobs.get(job_id)
+        if state is None or state["status"] in ("done", "failed"):
+            # Final states are read from disk, so any server process can answer for them
+            state = read_report(self.directory, job_id) or state
+        return {key: value for key, value in state.items() if key != "updated"} if state else None
+
+    def remove_expired(self, max_age):
+        """Forgets jobs not updated for max_age seconds (their files go with the issue spools)."""
+        cutoff = time.time() - max_age
+        with self._lock:
+            for job_id in [job_id for job_id, state in self.jobs.items() if state["updated"] < cutoff]:
+                del self.jobs[job_id]
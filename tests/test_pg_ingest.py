@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from pg_ingest import replace_statements, upsert_rows
+from security_db import KEY_FIELDS
+
+# e.g. TEST_POSTGRES_DSN="dbname=postgres host=localhost user=postgres"
+DSN = os.environ.get("TEST_POSTGRES_DSN")
+pytestmark = pytest.mark.skipif(not DSN, reason="TEST_POSTGRES_DSN is not set")
+
+KEY_COLUMNS = KEY_FIELDS + ["applied_date"]
+COLUMNS = KEY_COLUMNS + ["price"]
+
+@pytest.fixture
+def conn():
+    conn = psycopg2.connect(DSN)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS upsert_test;")
+        cur.execute("CREATE TABLE upsert_test (%s);" % ", ".join(f'"{col}" TEXT' for col in COLUMNS))
+    yield conn
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE IF EXISTS upsert_test;")
+    conn.close()
+
+def test_delete_probes_the_key_index(conn):
+    keys = ", ".join(f"'{col}' || g" for col in KEY_FIELDS)
+    key_columns = ", ".join(f'"{col}"' for col in KEY_COLUMNS)
+    with conn.cursor() as cur:
+        cur.execute(f"INSERT INTO upsert_test SELECT {keys}, '2025-01-01', '1' FROM generate_series(1, 50000) g;")
+        cur.execute(f"CREATE INDEX upsert_test_key_date_idx ON upsert_test ({key_columns});")
+        cur.execute("ANALYZE upsert_test;")
+        cur.execute("BEGIN;")
+        cur.execute("CREATE TEMP TABLE upsert_test_delta (LIKE upsert_test) ON COMMIT DROP;")
+        cur.execute(f"INSERT INTO upsert_test_delta SELECT {keys}, '2025-01-01', '2' FROM generate_series(1, 500) g;")
+        delete = replace_statements("upsert_test", "upsert_test_delta", COLUMNS, KEY_COLUMNS)[1]
+        cur.execute("EXPLAIN " + delete)
+        plan = "\n".join(row[0] for row in cur.fetchall())
+        cur.execute("ROLLBACK;")
+    assert "Seq Scan on upsert_test t" not in plan, plan
+    index_cond = next(line for line in plan.splitlines() if "Index Cond" in line)
+    assert all(col in index_cond for col in KEY_COLUMNS), plan
+
+def test_upsert_replaces_rows_missing_a_key_column(conn):
+    columns = [col for col in COLUMNS if col != "asset_group"]
+    row = [f"{col}-1" for col in KEY_COLUMNS if col != "asset_group"]
+    upsert_rows(conn, [row + ["1"]], "upsert_test", columns, KEY_COLUMNS)
+    upsert_rows(conn, [row + ["2"]], "upsert_test", columns, KEY_COLUMNS)
+    with conn.cursor() as cur:
+        cur.execute('SELECT "asset_group", "price" FROM upsert_test;')
+        assert cur.fetchall() == [("", "2")]
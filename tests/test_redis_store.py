@@ -0,0 +1,16 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from redis_store import PACKED_FIELD, RecordWriter
+
+ROW = {"figi": "BBG000B9XRY4", "currency": "USD", "asset_class": "Equity", "asset_group": "Tech",
+       "applied_date": "2025-02-16", "price": "1"}
+
+def test_replace_drops_fields_of_another_encoding():
+    r = fakeredis.FakeRedis()
+    RecordWriter(r, "packed").write([("key", ROW)])
+    assert r.hexists("key", PACKED_FIELD)
+    RecordWriter(r, "plain", replace=True).write([("key", dict(ROW, price="2"))])
+    assert not r.hexists("key", PACKED_FIELD)
+    assert r.hget("key", "price") == b"2"
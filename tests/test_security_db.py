@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+from psycopg2.pool import PoolError
+
+import security_db
+
+class StubConnection:
+    closed = 0
+    autocommit = False
+
+class StubPool:
+    """Behaves like ThreadedConnectionPool: getconn raises once maxconn connections are out."""
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        self.maxconn = maxconn
+        self.out = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def getconn(self):
+        with self.lock:
+            if self.out >= self.maxconn:
+                raise PoolError("connection pool exhausted")
+            self.out += 1
+            self.peak = max(self.peak, self.out)
+            return StubConnection()
+
+    def putconn(self, conn, close=False):
+        with self.lock:
+            self.out -= 1
+
+def test_connection_waits_when_the_pool_is_full(monkeypatch):
+    monkeypatch.setattr(security_db, "ThreadedConnectionPool", StubPool)
+    db = security_db.SecurityMasterDB("dbname=stub", maxconn=3)
+    errors = []
+
+    def use():
+        try:
+            with db.connection():
+                time.sleep(0.05)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=use) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert db._pool.peak == 3
+    assert db._pool.out == 0
+
+def test_connection_times_out(monkeypatch):
+    monkeypatch.setattr(security_db, "ThreadedConnectionPool", StubPool)
+    db = security_db.SecurityMasterDB("dbname=stub", maxconn=1, pool_timeout=0.1)
+    with db.connection():
+        with pytest.raises(PoolError):
+            with db.connection():
+                pass
+    with db.connection():
+        pass
@@ -0,0 +1,73 @@
+import io
+import os
+import threading
+import time
+
+import pytest
+
+from generate_soi import SOIGenerator
+from soi_jobs import SoiJobRunner, validate_soi
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class ListSpool:
+    def __init__(self):
+        self.issues = []
+        self.count = 0
+
+    def append(self, issues):
+        self.issues.extend(issues)
+        self.count += len(issues)
+
+def check_digit_issues(issues):
+    return [issue for issue in issues if issue["Message"].startswith("Check digit")]
+
+def test_generated_soi_has_no_check_digit_issues(tmp_path):
+    filename = tmp_path / "soi.csv"
+    SOIGenerator().generate_csv(5000, str(filename))
+    spool = ListSpool()
+    with open(filename, newline="", encoding="utf-8") as f:
+        summary = validate_soi(f, spool, preview_size=10)
+    assert summary["totalRows"] == 5000
+    assert check_digit_issues(spool.issues) == []
+
+def test_response_file_is_clean():
+    spool = ListSpool()
+    with open(os.path.join(REPO, "response_2025-02-16.csv"), newline="", encoding="utf-8") as f:
+        summary = validate_soi(f, spool, preview_size=10)
+    assert summary["errorCount"] == 0
+    assert spool.issues == []
+
+def test_published_scheme_accepts_listed_identifiers():
+    stream = io.StringIO("FIGI,CUSIP,SEDOL,ISIN\nBBG000B9XRY4,037833100,2046251,US0378331005\n")
+    spool = ListSpool()
+    validate_soi(stream, spool, preview_size=10, check_digits="published")
+    assert spool.issues == []
+
+def test_upload_of_generated_soi(tmp_path, monkeypatch):
+    app = pytest.importorskip("app")
+    runner = SoiJobRunner(str(tmp_path), 1, emit=lambda state: None,
+                          start_background_task=lambda task: threading.Thread(target=task, daemon=True).start())
+    monkeypatch.setattr(app, "soi_jobs", runner)
+    monkeypatch.setitem(app.app.config, "SOI_ERROR_SPOOL_DIR", str(tmp_path))
+    generated = tmp_path / "generated.csv"
+    SOIGenerator().generate_csv(2000, str(generated))
+
+    client = app.app.test_client()
+    response = client.post("/upload_soi", data={"file": (open(generated, "rb"), "soi.csv")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 202
+    job_id = response.get_json()["jobId"]
+    deadline = time.time() + 60
+    while True:
+        state = client.get(f"/upload_soi_status?job_id={job_id}").get_json()
+        if state["status"] in ("done", "failed") or time.time() > deadline:
+            break
+        time.sleep(0.1)
+    assert state["status"] == "done"
+    summary = state["summary"]
+    assert summary["totalRows"] == 2000
+    issues = summary["errorData"]
+    if summary["uploadId"]:
+        issues = client.get(f"/upload_soi_errors?upload_id={job_id}&start=0&end={summary['issueCount']}").get_json()["rows"]
+    assert check_digit_issues(issues) == []